@@ -0,0 +1,71 @@
+"""Test-time augmentation for borderline leaves.
+
+The upload is decoded once, slightly larger than the model input, and every
+augmented view (flips, corner crops, small rotations) is cut from it with a
+single fancy-indexing gather. The resulting (V, H, W, 3) batch goes through
+the classifier in one call and the softmax rows are averaged.
+"""
+import functools
+
+import numpy as np
+
+# Views are decoded from an image this much larger than the model input, so
+# crops and rotations have real pixels to draw on.
+SCALE = 1.15
+
+# (dx, dy, flip_x, flip_y, degrees); dx/dy move the crop by a fraction of the margin.
+DEFAULT_VIEWS = (
+    (0, 0, False, False, 0),
+    (0, 0, True, False, 0),
+    (0, 0, False, True, 0),
+    (-1, -1, False, False, 0),
+    (1, -1, False, False, 0),
+    (-1, 1, False, False, 0),
+    (1, 1, False, False, 0),
+    (0, 0, False, False, 10),
+    (0, 0, False, False, -10),
+)
+
+
+def source_size(size, scale=SCALE):
+    """(width, height) to decode at so views of ``size`` can be cut from it."""
+    return round(size[0] * scale), round(size[1] * scale)
+
+
+@functools.lru_cache(maxsize=8)
+def _gather_index(src_shape, out_shape, views):
+    """Flat source-pixel index of every output pixel of every view, shape (V, h*w)."""
+    src_h, src_w = src_shape
+    h, w = out_shape
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float64)
+    ys -= (h - 1) / 2.0
+    xs -= (w - 1) / 2.0
+    margin_y = (src_h - h) / 2.0
+    margin_x = (src_w - w) / 2.0
+
+    index = np.empty((len(views), h * w), dtype=np.intp)
+    for v, (dx, dy, flip_x, flip_y, degrees) in enumerate(views):
+        x = -xs if flip_x else xs
+        y = -ys if flip_y else ys
+        theta = np.deg2rad(degrees)
+        cos, sin = np.cos(theta), np.sin(theta)
+        sx = cos * x - sin * y + (src_w - 1) / 2.0 + dx * margin_x
+        sy = sin * x + cos * y + (src_h - 1) / 2.0 + dy * margin_y
+        rows = np.clip(np.rint(sy), 0, src_h - 1).astype(np.intp)
+        cols = np.clip(np.rint(sx), 0, src_w - 1).astype(np.intp)
+        index[v] = (rows * src_w + cols).ravel()
+    return index
+
+
+def tta_batch(image, size, views=DEFAULT_VIEWS):
+    """Stack ``views`` of an (H, W, 3) ``image`` into a (V, height, width, 3) batch of ``size``."""
+    width, height = size
+    src_h, src_w = image.shape[:2]
+    index = _gather_index((src_h, src_w), (height, width), tuple(views))
+    flat = image.reshape(src_h * src_w, image.shape[2])
+    return flat[index].reshape(len(views), height, width, image.shape[2])
+
+
+def predict_averaged(predict_fns, batch):
+    """Mean softmax over every image in ``batch`` and every model in ``predict_fns``."""
+    return np.mean([predict(batch).mean(axis=0) for predict in predict_fns], axis=0)
@@ -0,0 +1,125 @@
+"""Micro-batching of concurrent inference requests.
+
+Requests arriving within a short window are stacked into one (N, H, W, 3)
+tensor so the classifier runs once per batch instead of once per image.
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+
+from process_local import ProcessThreads
+
+
+class _Pending:
+    __slots__ = ('pixels', 'enqueued', 'done', 'result', 'error')
+
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collect requests for up to ``window_ms`` or ``max_batch`` images, then run ``predict_fn`` once.
+
+    ``workers`` batches can be in flight at once, for a ``predict_fn`` that
+    runs outside the GIL (see ``inference_pool.ProcessPool``).
+    """
+
+    def __init__(self, predict_fn, window_ms=10, max_batch=16, workers=1):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = ProcessThreads(self._run, 'micro-batcher', self.workers, reset=self._new_process)
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._inference_total = 0.0
+
+    def _new_process(self):
+        self._queue = queue.Queue()
+
+    def submit(self, pixels):
+        """Queue one (H, W, 3) image and block until its probability row is ready."""
+        self._threads.ensure_started()
+        pending = _Pending(pixels)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def pending(self):
+        """Number of images waiting for the next batch."""
+        return self._queue.qsize()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            try:
+                probabilities = self.predict_fn(np.stack([p.pixels for p in batch]))
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+                    p.done.set()
+                continue
+            finished = time.monotonic()
+
+            for p, row in zip(batch, probabilities):
+                p.result = row
+                p.done.set()
+
+            waits = [started - p.enqueued for p in batch]
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._wait_total += sum(waits)
+                self._wait_max = max(self._wait_max, max(waits))
+                self._inference_total += finished - started
+
+    def stats(self):
+        """Batch size and queue wait metrics for tuning the window."""
+        with self._lock:
+            batches = self._batches or 1
+            items = self._items or 1
+            return {
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "workers": self.workers,
+                "batches": self._batches,
+                "images": self._items,
+                "pending": self.pending(),
+                "mean_batch_size": self._items / batches,
+                "batch_size_counts": dict(sorted(self._batch_sizes.items())),
+                "mean_wait_ms": self._wait_total / items * 1000.0,
+                "max_wait_ms": self._wait_max * 1000.0,
+                "mean_inference_ms": self._inference_total / batches * 1000.0,
+            }
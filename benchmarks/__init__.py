@@ -0,0 +1,6 @@
+"""Latency and throughput benchmarks for the AgriPal routes.
+
+Run ``python -m benchmarks --help`` from the project root. By default the
+scenarios run in-process through Flask's test client; ``--gunicorn`` starts a
+local gunicorn server and drives it over HTTP instead.
+"""
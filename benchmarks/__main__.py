@@ -0,0 +1,126 @@
+"""Command-line entry point: ``python -m benchmarks``."""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.runner import (HttpTransport, TestClientTransport, compare, default_scenarios, git_commit,
+                               run_scenario, served_model, start_gunicorn)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Explicit store locations would bypass the scratch instance folder.
+STORE_VARIABLES = ('PREDICTION_CACHE_PATH', 'JOB_STORE_PATH', 'OUTBREAK_STORE_PATH', 'CASE_INDEX_PATH',
+                   'RESUMABLE_UPLOAD_PATH', 'KNOWLEDGE_BUNDLE_PATH', 'TEMPLATE_CACHE_DIR')
+# The app runs from a scratch directory, so model paths must not be relative.
+MODEL_DEFAULTS = {'MODEL_PATH': 'plant_diseases_model.npz', 'CROP_MODEL_PATH': 'crop_model.npz'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('--scenarios', help="Comma-separated subset of scenarios to run")
+    parser.add_argument('--requests', type=int, default=50, help="Measured requests per scenario")
+    parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=1, help="Client threads")
+    parser.add_argument('--model', help="Model file to load (sets MODEL_PATH)")
+    parser.add_argument('--gunicorn', action='store_true', help="Benchmark a locally started gunicorn")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers with --gunicorn")
+    parser.add_argument('--port', type=int, default=8765, help="gunicorn port with --gunicorn")
+    parser.add_argument('--url', help="Benchmark an already running server at this base URL")
+    parser.add_argument('--save', help="Write results to this JSON file")
+    parser.add_argument('--compare', help="Baseline JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Allowed p95 slowdown versus the baseline before failing (fraction)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='agripal-bench-')
+    env = dict(os.environ)
+    # Benchmark diagnoses must not reach the real outbreak counts, case index or caches.
+    env['APP_INSTANCE_PATH'] = os.path.join(workdir, 'instance')
+    for variable in STORE_VARIABLES:
+        env.pop(variable, None)
+    if args.model:
+        env['MODEL_PATH'] = args.model
+    for variable, filename in MODEL_DEFAULTS.items():
+        env[variable] = os.path.abspath(env.get(variable) or os.path.join(PROJECT_ROOT, filename))
+    if env.get('ENSEMBLE_MODEL_PATHS'):
+        env['ENSEMBLE_MODEL_PATHS'] = ','.join(
+            os.path.abspath(path) for path in env['ENSEMBLE_MODEL_PATHS'].split(',') if path)
+
+    scenarios = default_scenarios()
+    if args.scenarios:
+        wanted = set(args.scenarios.split(','))
+        scenarios = [s for s in scenarios if s.name in wanted]
+
+    server = None
+    if args.url:
+        transport, mode = HttpTransport(args.url), 'http'
+    elif args.gunicorn:
+        server = start_gunicorn(args.port, args.workers, PROJECT_ROOT, workdir, env)
+        transport, mode = HttpTransport(f'http://127.0.0.1:{args.port}', server.pid), 'gunicorn'
+    else:
+        # Uploads land in ./static/uploads, so run the app from a scratch directory.
+        os.environ.update(env)
+        for variable in STORE_VARIABLES:
+            os.environ.pop(variable, None)
+        sys.path.insert(0, PROJECT_ROOT)
+        os.chdir(workdir)
+        import main as app_module
+        transport, mode = TestClientTransport(app_module.app), 'test-client'
+
+    results = {}
+    try:
+        if transport.in_process:
+            model_version = app_module.model.version if app_module.model is not None else None
+        else:
+            model_version = served_model(transport.base_url)
+        if model_version is None:
+            # Every predict scenario would only time the maintenance page.
+            sys.exit(f"{args.url} has no model loaded" if args.url
+                     else f"No model at {env['MODEL_PATH']}; pass --model")
+        for scenario in scenarios:
+            result = run_scenario(transport, scenario, count=args.requests, concurrency=args.concurrency,
+                                  warmup=args.warmup)
+            results[scenario.name] = result
+            print(f"{scenario.name:16s} p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  "
+                  f"p99 {result['p99_ms']:8.2f} ms  {result['requests_per_sec']:8.1f} req/s  "
+                  f"errors {result['errors']}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "mode": mode,
+            "model": model_version,
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(os.path.join(PROJECT_ROOT, args.save) if not os.path.isabs(args.save) else args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        path = args.compare if os.path.isabs(args.compare) else os.path.join(PROJECT_ROOT, args.compare)
+        with open(path) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(report, baseline, args.tolerance)
+        print('\n'.join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""Drive scenarios against the app and collect latency, throughput and memory figures."""
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.workloads import IMAGE_SIZES, chat_queries, synthetic_jpeg, unique_variants
+
+
+class Scenario:
+    """A named, endless source of requests: dicts with method, path and optional json/form/files."""
+
+    def __init__(self, name, make_requests):
+        self.name = name
+        self.make_requests = make_requests
+
+
+def _predict_requests(data, unique=True):
+    source = unique_variants(data) if unique else iter(lambda: data, None)
+    for payload in source:
+        yield {
+            'method': 'POST',
+            'path': '/predict',
+            'form': {'location': 'Benchmark Farm'},
+            'files': {'image': ('image.jpg', payload)},
+        }
+
+
+def _chat_requests():
+    for message in chat_queries():
+        yield {'method': 'POST', 'path': '/chat', 'json': {'message': message}}
+
+
+def _home_requests():
+    while True:
+        yield {'method': 'GET', 'path': '/'}
+
+
+def default_scenarios():
+    small = synthetic_jpeg(*IMAGE_SIZES['small'], seed=1)
+    phone = synthetic_jpeg(*IMAGE_SIZES['phone'], seed=2)
+    return [
+        Scenario('home', _home_requests),
+        Scenario('chat', _chat_requests),
+        Scenario('predict_small', lambda: _predict_requests(small)),
+        Scenario('predict_phone', lambda: _predict_requests(phone)),
+        Scenario('predict_repeat', lambda: _predict_requests(small, unique=False)),
+    ]
+
+
+class TestClientTransport:
+    """Send requests through Flask's in-process test client."""
+
+    in_process = True
+
+    def __init__(self, app):
+        self.app = app
+
+    def send(self, req):
+        client = self.app.test_client()
+        kwargs = {}
+        if 'json' in req:
+            kwargs['json'] = req['json']
+        if 'files' in req:
+            data = dict(req.get('form', {}))
+            for field, (filename, payload) in req['files'].items():
+                data[field] = (io.BytesIO(payload), filename)
+            kwargs['data'] = data
+            kwargs['content_type'] = 'multipart/form-data'
+        response = client.open(req['path'], method=req['method'], **kwargs)
+        response.get_data()
+        return response.status_code
+
+    def peak_rss_kb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class HttpTransport:
+    """Send requests over HTTP to a running server."""
+
+    in_process = False
+
+    def __init__(self, base_url, server_pid=None):
+        self.base_url = base_url.rstrip('/')
+        self.server_pid = server_pid
+
+    def _encode(self, req):
+        headers = {}
+        body = None
+        if 'json' in req:
+            body = json.dumps(req['json']).encode()
+            headers['Content-Type'] = 'application/json'
+        elif 'files' in req:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for name, value in req.get('form', {}).items():
+                parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+                )
+            for name, (filename, payload) in req['files'].items():
+                parts.append(
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n'.encode() + payload + b'\r\n'
+                )
+            parts.append(f'--{boundary}--\r\n'.encode())
+            body = b''.join(parts)
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        return body, headers
+
+    def send(self, req):
+        body, headers = self._encode(req)
+        request = urllib.request.Request(self.base_url + req['path'], data=body, headers=headers,
+                                         method=req['method'])
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def peak_rss_kb(self):
+        """Sum of the peak RSS of the server and its worker processes (Linux only)."""
+        if self.server_pid is None or not os.path.isdir('/proc'):
+            return None
+        pids = [self.server_pid]
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        if int(f.read().rsplit(')', 1)[1].split()[1]) == self.server_pid:
+                            pids.append(int(entry))
+                except (OSError, IndexError, ValueError):
+                    continue
+        total = 0
+        for pid in pids:
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmHWM:'):
+                            total += int(line.split()[1])
+            except OSError:
+                continue
+        return total
+
+
+def _timed(transport, req):
+    started = time.perf_counter()
+    status = transport.send(req)
+    return time.perf_counter() - started, status
+
+
+def _allocations(transport, requests, count):
+    """Mean peak Python heap growth (bytes) and allocated blocks per request."""
+    tracemalloc.start()
+    peaks, blocks = [], []
+    try:
+        for _ in range(count):
+            req = next(requests)
+            base, _ = tracemalloc.get_traced_memory()
+            base_blocks = sys.getallocatedblocks()
+            tracemalloc.reset_peak()
+            transport.send(req)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            blocks.append(sys.getallocatedblocks() - base_blocks)
+    finally:
+        tracemalloc.stop()
+    return float(np.mean(peaks)), float(np.mean(blocks))
+
+
+def run_scenario(transport, scenario, count=50, concurrency=1, warmup=5, allocation_samples=10):
+    requests = scenario.make_requests()
+    for _ in range(warmup):
+        transport.send(next(requests))
+
+    batch = [next(requests) for _ in range(count)]
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            outcomes = list(pool.map(lambda r: _timed(transport, r), batch))
+    else:
+        outcomes = [_timed(transport, r) for r in batch]
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, _ in outcomes]) * 1000.0
+    errors = sum(1 for _, status in outcomes if status >= 400)
+    result = {
+        "requests": count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+        "requests_per_sec": count / elapsed,
+        "peak_rss_kb": transport.peak_rss_kb(),
+    }
+    if transport.in_process and allocation_samples:
+        peak_bytes, net_blocks = _allocations(transport, requests, allocation_samples)
+        result["peak_alloc_bytes_per_request"] = peak_bytes
+        result["net_blocks_per_request"] = net_blocks
+    return result
+
+
+def start_gunicorn(port, workers, project_root, workdir, env, extra_args=()):
+    """Start ``gunicorn -c gunicorn.conf.py main:app`` on localhost and wait until it answers.
+
+    The deployed configuration is used, with only the bind address and worker count overridden.
+    """
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(project_root, 'gunicorn.conf.py'),
+               '-b', f'127.0.0.1:{port}', '-w', str(workers), '--pythonpath', project_root, *extra_args, 'main:app']
+    server = subprocess.Popen(command, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1).read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def served_model(base_url, timeout=60):
+    """Model version reported by a server's /healthz once it has warmed up; None if it has no model."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(base_url.rstrip('/') + '/healthz', timeout=5) as response:
+                return json.load(response)["model"]
+        except urllib.error.HTTPError as e:
+            # 503 while a worker warms up.
+            if e.code != 503 or time.monotonic() > deadline:
+                raise RuntimeError(f"{base_url}/healthz answered {e.code}")
+        time.sleep(0.2)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, tolerance):
+    """Return report lines and whether any scenario's p95 regressed beyond ``tolerance``."""
+    lines, regressed = [], False
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        ratio = result["p95_ms"] / previous["p95_ms"] if previous["p95_ms"] else 1.0
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressed = True
+        lines.append(f"{name:16s} p95 {previous['p95_ms']:9.2f} -> {result['p95_ms']:9.2f} ms "
+                     f"({(ratio - 1) * 100:+.1f}%){flag}")
+    return lines, regressed
@@ -0,0 +1,54 @@
+"""Synthetic request payloads: leaf-like JPEGs and a corpus of chat queries."""
+import io
+import itertools
+
+import numpy as np
+from PIL import Image
+
+# (name, width, height) of the generated photos.
+IMAGE_SIZES = {
+    'small': (640, 480),
+    'phone': (4000, 3000),
+}
+
+CHAT_QUERIES = [
+    "What are the common symptoms of plant diseases?",
+    "my tomato leaves have yellow spots",
+    "how often should I spray chemicals",
+    "is overwatering bad for plants",
+    "how do I treat blight in tomatoes",
+    "what pesticide for aphids",
+    "can wind spread plant diseases",
+    "rust on my corn",
+    "what are common potato diseases",
+    "how do I upload a picture",
+    "what is the weather tomorrow",
+    "hello",
+]
+
+
+def synthetic_jpeg(width, height, seed=0, quality=90):
+    """A green, textured JPEG that compresses roughly like a real leaf photo."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, size=(height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    small[..., 1] = np.maximum(small[..., 1], 120)
+    img = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    noise = rng.integers(-12, 12, size=(height, width, 3), dtype=np.int16)
+    pixels = np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def unique_variants(data):
+    """Endless stream of byte-distinct copies of a JPEG, so content caches always miss.
+
+    Decoders ignore anything after the end-of-image marker, so appending a
+    counter changes the hash without changing the picture.
+    """
+    for i in itertools.count():
+        yield data + b'\0' + str(i).encode()
+
+
+def chat_queries():
+    return itertools.cycle(CHAT_QUERIES)
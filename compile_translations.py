@@ -0,0 +1,66 @@
+"""Build or update the per-language translation catalogs.
+
+    python compile_translations.py hi sw --backend argos
+
+The source strings are collected from several places: the ``_('...')``
+strings in the templates, the disease treatments, the FAQ, and the chat
+replies in ``main.py``. Only strings missing from
+``translations/<code>.json`` are sent to the backend. Translations already
+in a catalog, including hand corrections, are kept, and strings that are no
+longer used are dropped. Run it whenever the texts change, then restart the
+app.
+"""
+import argparse
+import os
+
+from translations import Catalog, SOURCE_LANGUAGE, data_messages, load_backend, template_messages
+
+
+def source_messages():
+    """Every translatable English string, without duplicates, in a stable order."""
+    from main import CHAT_REPLIES, app, disease_treatments, faq, maintenance_info
+
+    messages = template_messages(os.path.join(app.root_path, app.template_folder))
+    messages += data_messages(disease_treatments) + data_messages(maintenance_info)
+    messages += data_messages([[entry["question"], entry["answer"]] for entry in faq])
+    messages += list(CHAT_REPLIES.values())
+    return list(dict.fromkeys(m for m in messages if m.strip()))
+
+
+def update_catalog(path, language, messages, backend, batch_size=50):
+    """Translate what ``path`` is missing; returns (translated, dropped) counts."""
+    catalog = Catalog.load(path) if os.path.exists(path) else Catalog(language)
+    wanted = set(messages)
+    dropped = [m for m in catalog.messages if m not in wanted]
+    for message in dropped:
+        del catalog.messages[message]
+    missing = [m for m in messages if m not in catalog.messages]
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        catalog.messages.update(zip(batch, backend.translate(batch, SOURCE_LANGUAGE, language)))
+        # Save as we go, so an interrupted run keeps its progress.
+        catalog.save(path)
+    catalog.save(path)
+    return len(missing), len(dropped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('languages', nargs='+', help="Target language codes, e.g. hi sw es")
+    parser.add_argument('--backend', default=os.environ.get('TRANSLATION_BACKEND', 'argos'),
+                        help="'argos' or module:factory for a custom offline backend")
+    parser.add_argument('--output', default=os.environ.get('TRANSLATIONS_PATH', 'translations'))
+    args = parser.parse_args()
+
+    messages = source_messages()
+    backend = load_backend(args.backend)
+    os.makedirs(args.output, exist_ok=True)
+    for language in args.languages:
+        if language == SOURCE_LANGUAGE:
+            continue
+        translated, dropped = update_catalog(os.path.join(args.output, f'{language}.json'), language, messages, backend)
+        print(f"{language}: {len(messages)} strings, {translated} newly translated, {dropped} dropped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Convert the Keras plant disease model into the NumPy ``.npz`` format.
+
+Run this offline, wherever TensorFlow is installed:
+
+    python convert_model.py plant_diseases_model.h5 plant_diseases_model.npz
+
+The web app itself only needs NumPy to load the result (see ``inference.py``).
+"""
+import argparse
+import json
+
+import numpy as np
+
+
+def _fold_batch_norm(weights, bn):
+    """Fold a BatchNormalization layer into the preceding kernel and bias."""
+    kernel, bias = weights
+    gamma, beta, mean, variance = _bn_params(bn)
+    scale = gamma / np.sqrt(variance + bn.epsilon)
+    return kernel * scale, (bias - mean) * scale + beta
+
+
+def _bn_params(bn):
+    params = dict(zip([w.name.split('/')[-1].split(':')[0] for w in bn.weights], bn.get_weights()))
+    size = params['moving_mean'].shape[0]
+    gamma = params.get('gamma', np.ones(size, dtype=np.float32))
+    beta = params.get('beta', np.zeros(size, dtype=np.float32))
+    return gamma, beta, params['moving_mean'], params['moving_variance']
+
+
+def _kernel_and_bias(layer):
+    weights = layer.get_weights()
+    kernel = weights[0]
+    bias = weights[1] if len(weights) > 1 else np.zeros(kernel.shape[-1], dtype=np.float32)
+    return kernel, bias
+
+
+def convert(model, rescale=1.0, labels=None):
+    """Return (meta, arrays) describing ``model`` as NumPy layers."""
+    specs = []
+    weights = []
+    pending_linear = False
+
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        config = layer.get_config()
+
+        if kind in ('InputLayer', 'Dropout', 'SpatialDropout2D'):
+            continue
+
+        if kind == 'Rescaling':
+            rescale *= float(config['scale'])
+            continue
+
+        if kind == 'BatchNormalization':
+            if pending_linear:
+                weights[-1] = _fold_batch_norm(weights[-1], layer)
+            else:
+                gamma, beta, mean, variance = _bn_params(layer)
+                scale = gamma / np.sqrt(variance + layer.epsilon)
+                specs.append({'type': 'scale_shift'})
+                weights.append((scale, beta - mean * scale))
+            continue
+
+        activation = config.get('activation', 'linear')
+        if kind == 'Conv2D':
+            kernel, bias = _kernel_and_bias(layer)
+            specs.append({
+                'type': 'conv2d',
+                'kernel_size': list(config['kernel_size']),
+                'strides': list(config['strides']),
+                'padding': config['padding'],
+                'activation': activation,
+            })
+            weights.append((kernel, bias))
+        elif kind == 'Dense':
+            specs.append({'type': 'dense', 'activation': activation})
+            weights.append(_kernel_and_bias(layer))
+        elif kind == 'MaxPooling2D':
+            specs.append({
+                'type': 'max_pool2d',
+                'pool_size': list(config['pool_size']),
+                'strides': list(config['strides'] or config['pool_size']),
+                'padding': config['padding'],
+            })
+            weights.append(())
+        elif kind in ('Activation', 'ReLU', 'Softmax'):
+            activation = config.get('activation', kind.lower())
+            specs.append({'type': 'activation', 'activation': activation})
+            weights.append(())
+        elif kind == 'Flatten':
+            specs.append({'type': 'flatten'})
+            weights.append(())
+        elif kind == 'GlobalAveragePooling2D':
+            specs.append({'type': 'global_average_pool2d'})
+            weights.append(())
+        else:
+            raise ValueError(f"Unsupported layer type: {kind}")
+
+        # A batch-norm can only be folded into a layer with no non-linearity.
+        pending_linear = kind in ('Conv2D', 'Dense') and activation == 'linear'
+
+    arrays = {}
+    for i, (spec, params) in enumerate(zip(specs, weights)):
+        if spec['type'] == 'conv2d':
+            kernel, bias = params
+            # Flatten to (C * kh * kw, cout) to match the im2col window layout.
+            arrays[f'{i}.kernel'] = kernel.transpose(2, 0, 1, 3).reshape(-1, kernel.shape[-1])
+            arrays[f'{i}.bias'] = bias
+        elif spec['type'] == 'dense':
+            arrays[f'{i}.kernel'], arrays[f'{i}.bias'] = params
+        elif spec['type'] == 'scale_shift':
+            arrays[f'{i}.scale'], arrays[f'{i}.shift'] = params
+
+    meta = {
+        'input_shape': list(model.input_shape[1:]),
+        'rescale': rescale,
+        'labels': labels,
+        'layers': specs,
+    }
+    arrays = {name: np.asarray(a, dtype=np.float32) for name, a in arrays.items()}
+    return meta, arrays
+
+
+def save(path, meta, arrays):
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help="Keras model file (.h5 or .keras)")
+    parser.add_argument('target', help="Output .npz file")
+    parser.add_argument('--rescale', type=float, default=1.0,
+                        help="Factor applied to raw 0-255 pixels before the first layer")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from main import class_names
+
+    model = tf.keras.models.load_model(args.source, compile=False)
+    meta, arrays = convert(model, rescale=args.rescale, labels=class_names)
+    save(args.target, meta, arrays)
+    print(f"Wrote {args.target} ({len(meta['layers'])} layers)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Resized WebP and JPEG copies of uploads for the result page.
+
+Derivatives sit next to their original in the upload store, named
+``<sha256>.w<width>.<format>``. They are produced once, by a background
+thread, and the request that stored the upload only queues the work. Until
+they exist, ``resolve`` falls back to the original, so the ``srcset`` URLs
+on a result page always work.
+"""
+import os
+import queue
+import re
+import tempfile
+import threading
+
+from PIL import Image, ImageOps
+
+from preprocess import open_image
+from process_local import ProcessThreads
+
+WIDTHS = (320, 640, 1280)
+FORMATS = {'webp': ('WEBP', {'quality': 75, 'method': 4}),
+           'jpg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True})}
+
+DERIVATIVE_NAME = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})\.w(\d+)\.(webp|jpg)$')
+
+
+def derivative_path(relative, width, fmt):
+    """'ab/cd/<hash>.jpg' -> 'ab/cd/<hash>.w640.webp'."""
+    stem = relative.rsplit('.', 1)[0]
+    return f'{stem}.w{width}.{fmt}'
+
+
+class Derivatives:
+    def __init__(self, root, widths=WIDTHS, max_pixels=64_000_000):
+        self.root = root
+        self.widths = tuple(sorted(widths))
+        self.max_pixels = max_pixels
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._scheduled = set()
+        self._threads = ProcessThreads(self._run, 'derivatives', reset=self._new_process)
+
+    def _new_process(self):
+        self._queue = queue.Queue()
+        self._scheduled = set()
+
+    def schedule(self, relative):
+        """Queue derivative generation for an upload (path relative to the store root)."""
+        self._threads.ensure_started()
+        with self._lock:
+            if relative in self._scheduled:
+                return
+            self._scheduled.add(relative)
+        self._queue.put(relative)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            relative = self._queue.get()
+            try:
+                self.generate(relative)
+            except Exception:
+                # A corrupt or vanished upload just keeps being served as the original.
+                pass
+            finally:
+                with self._lock:
+                    self._scheduled.discard(relative)
+
+    def generate(self, relative):
+        """Write every missing derivative of ``relative``; returns how many were written."""
+        targets = [(w, fmt) for w in self.widths for fmt in FORMATS
+                   if not os.path.exists(os.path.join(self.root, derivative_path(relative, w, fmt)))]
+        if not targets:
+            return 0
+        with open(os.path.join(self.root, relative), 'rb') as f:
+            data = f.read()
+        with open_image(data, self.max_pixels) as img:
+            img.draft('RGB', (self.widths[-1], self.widths[-1]))
+            image = ImageOps.exif_transpose(img).convert('RGB')
+        written = 0
+        # Largest first, so each size is reduced from the previous one rather than the original.
+        for width in sorted({w for w, _ in targets}, reverse=True):
+            if width < image.width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))),
+                                     Image.LANCZOS, reducing_gap=3.0)
+            for fmt in FORMATS:
+                if (width, fmt) in targets:
+                    self._save(image, derivative_path(relative, width, fmt), fmt)
+                    written += 1
+        return written
+
+    def _save(self, image, relative, fmt):
+        path = os.path.join(self.root, relative)
+        pil_format, options = FORMATS[fmt]
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, pil_format, **options)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def srcset(self, relative, fmt):
+        """``srcset`` candidates as (derivative path, width) pairs."""
+        return [(derivative_path(relative, w, fmt), w) for w in self.widths]
+
+    def resolve(self, name):
+        """Return the stored file to serve for derivative ``name`` and whether it is the derivative.
+
+        A missing derivative resolves to its original (and is queued again);
+        returns (None, False) if neither exists.
+        """
+        match = DERIVATIVE_NAME.match(name)
+        if match is None:
+            return None, False
+        if os.path.exists(os.path.join(self.root, name)):
+            return name, True
+        shard = os.path.join(self.root, match.group(1), match.group(2))
+        digest = match.group(3)
+        try:
+            originals = [e.name for e in os.scandir(shard)
+                         if e.name.startswith(digest + '.') and e.name.count('.') == 1]
+        except FileNotFoundError:
+            return None, False
+        if not originals:
+            return None, False
+        original = f'{match.group(1)}/{match.group(2)}/{originals[0]}'
+        self.schedule(original)
+        return original, False
@@ -0,0 +1,112 @@
+"""Compare a quantized model against the float model over a labelled image folder.
+
+    python evaluate_model.py plant_diseases_model.npz plant_diseases_model.i8 dataset/
+
+The folder holds one sub-folder per class, named after the class label
+(spelling and ``___`` separators are ignored, e.g. ``Tomato___Late_blight``).
+The report gives each model's top-1 accuracy and speed. It also gives how
+often the two models agree, and how far apart their probabilities are.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from inference import load_model
+from knowledge_base import normalize_label
+from preprocess import UploadError, decode_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def labelled_images(root, labels):
+    """Yield (path, class index) for images in class-named sub-folders of ``root``."""
+    index = {normalize_label(label): i for i, label in enumerate(labels)}
+    for folder in sorted(os.listdir(root)):
+        directory = os.path.join(root, folder)
+        if not os.path.isdir(directory):
+            continue
+        if normalize_label(folder) not in index:
+            print(f"Skipping {folder}: not a known class")
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(directory, name), index[normalize_label(folder)]
+
+
+def evaluate(reference, candidate, samples, batch_size=32, max_pixels=64_000_000):
+    """Return a dict of accuracy and agreement figures for two models over ``samples``."""
+    truth, ref_probs, cand_probs = [], [], []
+    timings = {'reference': 0.0, 'candidate': 0.0}
+    batch, batch_truth = [], []
+
+    def flush():
+        x = np.stack(batch)
+        for name, model, out in (('reference', reference, ref_probs), ('candidate', candidate, cand_probs)):
+            started = time.perf_counter()
+            out.append(model.predict(x))
+            timings[name] += time.perf_counter() - started
+        truth.extend(batch_truth)
+        batch.clear()
+        batch_truth.clear()
+
+    for path, label in samples:
+        try:
+            with open(path, 'rb') as f:
+                batch.append(decode_image(f.read(), reference.input_size, max_pixels))
+        except (OSError, UploadError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        batch_truth.append(label)
+        if len(batch) == batch_size:
+            flush()
+    if batch:
+        flush()
+    if not truth:
+        raise SystemExit("No labelled images found")
+
+    truth = np.array(truth)
+    ref = np.concatenate(ref_probs)
+    cand = np.concatenate(cand_probs)
+    ref_top, cand_top = ref.argmax(axis=1), cand.argmax(axis=1)
+    diff = np.abs(ref - cand)
+    return {
+        "images": len(truth),
+        "reference_accuracy": float((ref_top == truth).mean()),
+        "candidate_accuracy": float((cand_top == truth).mean()),
+        "top1_agreement": float((ref_top == cand_top).mean()),
+        "mean_abs_prob_diff": float(diff.mean()),
+        "max_abs_prob_diff": float(diff.max()),
+        "reference_ms_per_image": timings['reference'] / len(truth) * 1000.0,
+        "candidate_ms_per_image": timings['candidate'] / len(truth) * 1000.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('reference', help="Float model (.npz from convert_model.py)")
+    parser.add_argument('candidate', help="Model to check, e.g. the output of quantize_model.py")
+    parser.add_argument('images', help="Folder with one sub-folder of images per class")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--min-agreement', type=float, default=None,
+                        help="Exit non-zero if top-1 agreement falls below this fraction")
+    args = parser.parse_args()
+
+    reference = load_model(args.reference)
+    candidate = load_model(args.candidate)
+    if candidate.input_shape != reference.input_shape:
+        raise SystemExit("The two models expect different input shapes")
+    labels = reference.labels
+    if labels is None:
+        from main import class_names as labels
+
+    report = evaluate(reference, candidate, labelled_images(args.images, labels), args.batch_size)
+    for key, value in report.items():
+        print(f"{key:24s} {value:.4f}" if isinstance(value, float) else f"{key:24s} {value}")
+    if args.min_agreement is not None and report["top1_agreement"] < args.min_agreement:
+        raise SystemExit(f"Top-1 agreement {report['top1_agreement']:.4f} is below {args.min_agreement}")
+
+
+if __name__ == '__main__':
+    main()
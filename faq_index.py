@@ -0,0 +1,97 @@
+"""BM25 retrieval over the chatbot FAQ.
+
+The index is built once at startup: every entry's question and answer are
+tokenized into a vocabulary, and the per-term BM25 weights are stored as a
+CSR sparse matrix (term -> documents) in NumPy arrays. A query then costs one
+slice per query term and a ``bincount`` to accumulate document scores.
+"""
+import re
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it its my of on or
+should the to what when which with you your there this that any if me our we
+""".split())
+
+
+def _stem(token):
+    # Light plural stripping so "diseases" matches "disease" and "leaves" matches "leaf".
+    if len(token) > 4 and token.endswith('ves'):
+        return token[:-3] + 'f'
+    if len(token) > 4 and token.endswith('oes'):
+        return token[:-2]
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed and plurals stripped."""
+    return [_stem(t) for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class FaqIndex:
+    def __init__(self, entries, k1=1.2, b=0.75, answer_weight=0.5, min_score=1.5):
+        self.entries = list(entries)
+        self.min_score = min_score
+        self.vocabulary = {}
+
+        # Term frequencies per document, with answer words counting less than question words.
+        rows, cols, freqs = [], [], []
+        lengths = np.zeros(len(self.entries), dtype=np.float32)
+        for doc, entry in enumerate(self.entries):
+            counts = {}
+            for weight, field in ((1.0, entry["question"]), (answer_weight, entry["answer"])):
+                for token in tokenize(field):
+                    counts[token] = counts.get(token, 0.0) + weight
+            for token, tf in counts.items():
+                rows.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                cols.append(doc)
+                freqs.append(tf)
+            lengths[doc] = sum(counts.values())
+
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        freqs = np.asarray(freqs, dtype=np.float32)
+        n_docs = max(len(self.entries), 1)
+        avg_length = lengths.mean() if len(self.entries) else 1.0
+
+        doc_freq = np.bincount(rows, minlength=len(self.vocabulary))
+        idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths[cols] / avg_length)
+        weights = idf[rows] * freqs * (k1 + 1) / (freqs + norm)
+
+        # CSR layout: postings for term t are doc_ids[indptr[t]:indptr[t + 1]].
+        order = np.argsort(rows, kind='stable')
+        self.doc_ids = cols[order]
+        self.weights = weights[order].astype(np.float32)
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def scores(self, query):
+        """BM25 score of every entry for ``query``."""
+        terms = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not terms:
+            return np.zeros(len(self.entries), dtype=np.float32)
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in terms]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        return np.bincount(docs, weights=weights, minlength=len(self.entries))
+
+    def search(self, query, k=3):
+        """Return up to ``k`` (entry, score) pairs scoring at least ``min_score``, best first."""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.entries[i], float(scores[i])) for i in top if scores[i] >= self.min_score]
@@ -0,0 +1,39 @@
+"""Production gunicorn settings.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master (``preload_app``). The treatment and
+FAQ tables, the model, the chat index and the compiled templates are then
+shared copy-on-write by every forked worker. The master warms everything up
+before forking, and each worker runs one more dummy inference before it
+accepts traffic, because BLAS thread pools do not survive fork. ``/healthz``
+answers 200 only in a worker that has finished warming up.
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    import main
+
+    seconds = main.warm_up(start_pool=False)
+    # Keep the garbage collector in the workers from touching (and so copying) the preloaded objects.
+    gc.collect()
+    gc.freeze()
+    server.log.info("Warmed up in %.2fs, forking workers", seconds)
+
+
+def post_worker_init(worker):
+    import main
+
+    seconds = main.warm_up()
+    worker.log.info("Worker %s ready after %.2fs warm-up", worker.pid, seconds)
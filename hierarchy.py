@@ -0,0 +1,80 @@
+"""Two-stage crop-then-disease classification.
+
+Stage one is a tiny model (see ``train_crop_model.py``) over
+``<crop>_healthy`` / ``<crop>_diseased`` outputs, run on a thumbnail. When
+it is confident that a leaf is healthy, its output is expanded to the full
+class vector and the large classifier never runs. Otherwise the full
+classifier runs, and its output is restricted to the crop's classes when
+stage one (or a crop hint from the client) is sure of the crop.
+"""
+import numpy as np
+from PIL import Image
+
+from knowledge_base import crop_of
+
+
+def downsample(pixels, size):
+    """Resize an (H, W, 3) float32 0-255 image to ``size`` (width, height) for stage one."""
+    img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return np.asarray(img.resize(size, Image.BOX), dtype=np.float32)
+
+
+class CropHierarchy:
+    def __init__(self, knowledge_base, threshold=0.9):
+        self.threshold = threshold
+        self.size = len(knowledge_base)
+        self.crops = []
+        self.crop_classes = {}
+        for condition in knowledge_base:
+            if condition.crop not in self.crop_classes:
+                self.crops.append(condition.crop)
+                self.crop_classes[condition.crop] = []
+            self.crop_classes[condition.crop].append(condition.index)
+        self.crop_classes = {crop: np.array(indices) for crop, indices in self.crop_classes.items()}
+        self._by_key = {crop.casefold(): crop for crop in self.crops}
+
+        # Stage-one outputs, in a fixed order, and how each spreads over the full classes.
+        self.stage_outputs = []
+        rows = []
+        for crop in self.crops:
+            indices = self.crop_classes[crop]
+            healthy = [i for i in indices if knowledge_base[i].healthy]
+            diseased = [i for i in indices if not knowledge_base[i].healthy]
+            for is_healthy, members in ((True, healthy), (False, diseased)):
+                if members:
+                    self.stage_outputs.append((crop, is_healthy))
+                    row = np.zeros(self.size, dtype=np.float32)
+                    row[members] = 1.0 / len(members)
+                    rows.append(row)
+        self.expand = np.stack(rows)
+        self.stage_labels = [f"{crop}_{'healthy' if healthy else 'diseased'}" for crop, healthy in self.stage_outputs]
+
+    def stage_label(self, index):
+        """Stage-one label for a full class index, e.g. 'Tomato_Late_blight' -> 'Tomato_diseased'."""
+        for i, row in enumerate(self.expand):
+            if row[index]:
+                return self.stage_labels[i]
+        raise IndexError(index)
+
+    def resolve_crop(self, name):
+        """Canonical crop name for a client hint (case-insensitive), or None."""
+        if not name:
+            return None
+        return self._by_key.get(name.strip().casefold()) or self._by_key.get(crop_of(name.strip()).casefold())
+
+    def stage_one(self, stage_probabilities):
+        """Return (full probabilities if stage one can answer alone else None, confident crop or None)."""
+        top = int(np.argmax(stage_probabilities))
+        crop, healthy = self.stage_outputs[top]
+        if healthy and stage_probabilities[top] >= self.threshold:
+            return stage_probabilities @ self.expand, crop
+        crop_mass = sum(p for (c, _), p in zip(self.stage_outputs, stage_probabilities) if c == crop)
+        return None, crop if crop_mass >= self.threshold else None
+
+    def restrict(self, probabilities, crop):
+        """Zero every class outside ``crop`` and renormalise."""
+        restricted = np.zeros_like(probabilities)
+        indices = self.crop_classes[crop]
+        restricted[indices] = probabilities[indices]
+        total = restricted.sum()
+        return restricted / total if total > 0 else probabilities
@@ -0,0 +1,116 @@
+"""Precompressed response bodies with ETag handling.
+
+``CachedBody`` holds a body serialized once, plus its gzip (and, when the
+optional ``brotli`` package is installed, brotli) encodings and a strong
+ETag. Serving it is content negotiation plus a header lookup, and a
+matching ``If-None-Match`` short-circuits to ``304 Not Modified``.
+"""
+import gzip
+import hashlib
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth compressing.
+MIN_COMPRESS_BYTES = 512
+
+
+def content_etag(body):
+    return hashlib.sha256(body).hexdigest()[:20]
+
+
+def file_fingerprint(path):
+    """Short content hash of a file, used to version static asset URLs."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _encodings(body):
+    variants = {'identity': body}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        variants['gzip'] = gzip.compress(body, 9, mtime=0)
+        if brotli is not None:
+            variants['br'] = brotli.compress(body, quality=11)
+    return variants
+
+
+def negotiate(request, available):
+    """Pick the best content-coding the client accepts among ``available``."""
+    for encoding in ('br', 'gzip'):
+        if encoding in available and request.accept_encodings[encoding]:
+            return encoding
+    return 'identity'
+
+
+def variant_etag(etag, encoding):
+    """Distinct strong ETag per content-coding, as RFC 9110 requires."""
+    return etag if encoding == 'identity' else f'{etag}-{encoding}'
+
+
+def etag_matches(request, etag):
+    """True if ``If-None-Match`` names any encoding of ``etag``."""
+    tags = request.if_none_match
+    return bool(tags) and any(tags.contains(variant_etag(etag, e)) for e in ('identity', 'gzip', 'br'))
+
+
+def not_modified(etag, cache_control=None):
+    response = Response(status=304)
+    response.set_etag(etag)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+class CachedBody:
+    def __init__(self, body, mimetype, etag=None, last_modified=None):
+        self.mimetype = mimetype
+        self.variants = _encodings(body)
+        self.etag = etag or content_etag(body)
+        self.last_modified = last_modified
+
+    def response(self, request, cache_control=None):
+        """Serve the best encoding for ``request``, or 304 if the client's copy is current."""
+        encoding = negotiate(request, self.variants)
+        etag = variant_etag(self.etag, encoding)
+        if request.if_none_match:
+            if etag_matches(request, self.etag):
+                return not_modified(etag, cache_control)
+        elif self.last_modified is not None and request.if_modified_since is not None:
+            if self.last_modified <= request.if_modified_since:
+                return not_modified(etag, cache_control)
+
+        response = Response(self.variants[encoding], mimetype=self.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(self.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified
+        if cache_control:
+            response.headers['Cache-Control'] = cache_control
+        return response
+
+
+def dynamic_response(request, body, mimetype, etag=None, cache_control=None):
+    """Serve a per-request body, gzip-compressing it at a cheap level when worthwhile."""
+    encoding = 'identity'
+    if len(body) >= MIN_COMPRESS_BYTES and request.accept_encodings['gzip']:
+        body = gzip.compress(body, 1, mtime=0)
+        encoding = 'gzip'
+    response = Response(body, mimetype=mimetype)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if etag is not None:
+        response.set_etag(variant_etag(etag, encoding))
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,312 @@
+"""Pure-NumPy inference engine for the plant disease classifier.
+
+The Keras model is converted offline by ``convert_model.py`` into a compact
+``.npz`` archive holding a JSON layer description plus one array per weight.
+Batch-norm layers are folded into the preceding convolution or dense layer
+at conversion time, so the forward pass here is just im2col matmuls, pooling
+and a final softmax.
+
+``quantize_model.py`` can further turn that archive into a memory-mapped
+file with int8 weights: a JSON header followed by aligned raw arrays. Workers
+map it read-only, so they all share a single page-cache copy.
+"""
+import hashlib
+import json
+import struct
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _same_padding(size, kernel, stride):
+    """Return (before, after) padding matching Keras' 'same' mode."""
+    out = -(-size // stride)
+    total = max((out - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+
+def _pad(x, kernel, stride, padding, value=0.0):
+    if padding != 'same':
+        return x
+    top, bottom = _same_padding(x.shape[1], kernel[0], stride[0])
+    left, right = _same_padding(x.shape[2], kernel[1], stride[1])
+    if not (top or bottom or left or right):
+        return x
+    return np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=value)
+
+
+def _windows(x, kernel, stride):
+    """Strided (N, Ho, Wo, C, kh, kw) view of every receptive field of ``x``."""
+    view = sliding_window_view(x, kernel, axis=(1, 2))
+    return view[:, ::stride[0], ::stride[1]]
+
+
+def _activate(x, activation):
+    if activation == 'relu':
+        return np.maximum(x, 0, out=x)
+    if activation == 'softmax':
+        return softmax(x)
+    if activation == 'sigmoid':
+        return 1.0 / (1.0 + np.exp(-x))
+    return x
+
+
+def softmax(logits):
+    """Numerically stable softmax over the last axis."""
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class Int8Kernel:
+    """An int8 (K, cout) weight matrix with one float32 scale per output column.
+
+    ``x @ kernel`` dequantizes ``BLOCK_ROWS`` rows at a time, so the float copy
+    of a large layer never exists in memory all at once.
+    """
+    # Makes ``ndarray @ Int8Kernel`` defer to __rmatmul__.
+    __array_ufunc__ = None
+    BLOCK_ROWS = 2048
+
+    def __init__(self, values, scale):
+        self.values = values
+        self.scale = scale
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __rmatmul__(self, x):
+        out = np.zeros(x.shape[:-1] + (self.values.shape[1],), dtype=np.float32)
+        for start in range(0, self.values.shape[0], self.BLOCK_ROWS):
+            stop = start + self.BLOCK_ROWS
+            out += x[..., start:stop] @ self.values[start:stop].astype(np.float32)
+        out *= self.scale
+        return out
+
+
+class Conv2D:
+    def __init__(self, spec, kernel, bias):
+        self.kernel_size = tuple(spec['kernel_size'])
+        self.stride = tuple(spec.get('strides', (1, 1)))
+        self.padding = spec.get('padding', 'valid')
+        self.activation = spec.get('activation', 'linear')
+        # Weights are stored pre-flattened in (C, kh, kw) order to match the
+        # memory layout of the receptive-field windows.
+        self.kernel = kernel
+        self.bias = bias
+
+    def __call__(self, x):
+        x = _pad(x, self.kernel_size, self.stride, self.padding)
+        cols = _windows(x, self.kernel_size, self.stride)
+        n, h, w = cols.shape[:3]
+        out = cols.reshape(n * h * w, -1) @ self.kernel
+        out += self.bias
+        return _activate(out.reshape(n, h, w, -1), self.activation)
+
+
+class MaxPool2D:
+    def __init__(self, spec):
+        self.pool_size = tuple(spec['pool_size'])
+        self.stride = tuple(spec.get('strides') or self.pool_size)
+        self.padding = spec.get('padding', 'valid')
+
+    def __call__(self, x):
+        ph, pw = self.pool_size
+        if self.padding == 'valid' and self.stride == self.pool_size:
+            # Non-overlapping windows reduce to a reshape and a max.
+            n, h, w, c = x.shape
+            h, w = h // ph, w // pw
+            return x[:, :h * ph, :w * pw].reshape(n, h, ph, w, pw, c).max(axis=(2, 4))
+        x = _pad(x, self.pool_size, self.stride, self.padding, value=-np.inf)
+        return _windows(x, self.pool_size, self.stride).max(axis=(4, 5))
+
+
+class Dense:
+    def __init__(self, spec, kernel, bias):
+        self.activation = spec.get('activation', 'linear')
+        self.kernel = kernel
+        self.bias = bias
+
+    def __call__(self, x):
+        return _activate(x @ self.kernel + self.bias, self.activation)
+
+
+class ScaleShift:
+    """Batch-norm that could not be folded into a neighbouring layer."""
+
+    def __init__(self, spec, scale, shift):
+        self.scale = scale
+        self.shift = shift
+
+    def __call__(self, x):
+        return x * self.scale + self.shift
+
+
+class Activation:
+    def __init__(self, spec):
+        self.activation = spec['activation']
+
+    def __call__(self, x):
+        return _activate(x, self.activation)
+
+
+class Flatten:
+    def __init__(self, spec):
+        pass
+
+    def __call__(self, x):
+        return x.reshape(x.shape[0], -1)
+
+
+class GlobalAveragePool2D:
+    def __init__(self, spec):
+        pass
+
+    def __call__(self, x):
+        return x.mean(axis=(1, 2))
+
+
+LAYER_TYPES = {
+    'conv2d': (Conv2D, ('kernel', 'bias')),
+    'max_pool2d': (MaxPool2D, ()),
+    'dense': (Dense, ('kernel', 'bias')),
+    'scale_shift': (ScaleShift, ('scale', 'shift')),
+    'activation': (Activation, ()),
+    'flatten': (Flatten, ()),
+    'global_average_pool2d': (GlobalAveragePool2D, ()),
+}
+
+
+class Model:
+    """A sequential stack of NumPy layers converted from Keras."""
+
+    def __init__(self, layers, input_shape, rescale=1.0, labels=None, version=''):
+        self.layers = layers
+        self.input_shape = tuple(input_shape)
+        self.rescale = rescale
+        self.labels = labels
+        self.version = version
+
+    @property
+    def input_size(self):
+        """(width, height) of the model input, as PIL expects it."""
+        return self.input_shape[1], self.input_shape[0]
+
+    @property
+    def embedding_size(self):
+        """Width of the penultimate-layer embedding, i.e. the input of the last dense layer."""
+        return self.layers[self._head].kernel.shape[0]
+
+    @property
+    def _head(self):
+        heads = [i for i, layer in enumerate(self.layers) if isinstance(layer, Dense)]
+        if not heads:
+            raise ValueError("Model has no dense output layer")
+        return heads[-1]
+
+    def _inputs(self, batch):
+        x = np.asarray(batch, dtype=np.float32)
+        if x.ndim == 3:
+            x = x[np.newaxis]
+        if x.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected input of shape {self.input_shape}, got {x.shape[1:]}")
+        if self.rescale != 1.0:
+            x = x * np.float32(self.rescale)
+        return x
+
+    def predict(self, batch):
+        """Return softmax probabilities for an (N, H, W, 3) batch of RGB pixels."""
+        x = self._inputs(batch)
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+    def predict_features(self, batch):
+        """Like ``predict``, with the penultimate-layer embedding appended to every row.
+
+        Returns (N, classes + embedding_size), so it fits anywhere a plain
+        probability matrix is passed around (the micro-batcher, the process pool).
+        """
+        x = self._inputs(batch)
+        head = self._head
+        for layer in self.layers[:head]:
+            x = layer(x)
+        embedding = x.reshape(len(x), -1)
+        for layer in self.layers[head:]:
+            x = layer(x)
+        return np.concatenate([x, embedding], axis=1)
+
+    @classmethod
+    def from_arrays(cls, meta, arrays, version=''):
+        """Build a model from its layer description and a name -> array mapping."""
+        layers = []
+        for i, spec in enumerate(meta['layers']):
+            layer_cls, weight_names = LAYER_TYPES[spec['type']]
+            weights = []
+            for name in weight_names:
+                values = arrays[f'{i}.{name}']
+                if values.dtype == np.int8:
+                    weights.append(Int8Kernel(values, arrays[f'{i}.{name}_scale']))
+                else:
+                    weights.append(values)
+            layers.append(layer_cls(spec, *weights))
+        return cls(layers, meta['input_shape'], meta.get('rescale', 1.0), meta.get('labels'), version=version)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model written by ``convert_model.py``."""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {name: data[name].astype(np.float32) for name in data.files if name != 'meta'}
+        return cls.from_arrays(meta, arrays, version=file_digest(path))
+
+    @classmethod
+    def load_mapped(cls, path):
+        """Map a file written by ``quantize_model.py`` read-only; weights stay in the page cache."""
+        meta, entries = read_mapped_header(path)
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        arrays = {}
+        for name, entry in entries.items():
+            dtype = np.dtype(entry['dtype'])
+            count = int(np.prod(entry['shape'], dtype=np.int64))
+            start = entry['offset']
+            arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+        return cls.from_arrays(meta, arrays, version=file_digest(path))
+
+
+# Memory-mapped model files: magic, little-endian u64 header length, JSON
+# header, then each array at an ALIGNMENT-byte boundary.
+MAPPED_MAGIC = b'AGRIMAP1'
+ALIGNMENT = 64
+
+
+def read_mapped_header(path):
+    """Return (meta, {name: {dtype, shape, offset}}) from a memory-mapped model file."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAPPED_MAGIC)) != MAPPED_MAGIC:
+            raise ValueError(f"{path} is not a memory-mapped model file")
+        (length,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length))
+    return header['meta'], header['arrays']
+
+
+def is_mapped(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAPPED_MAGIC)) == MAPPED_MAGIC
+
+
+def file_digest(path):
+    """Short content hash identifying a model file, used to key cached results."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def load_model(path):
+    """Load the classifier at ``path``, either a ``.npz`` archive or a memory-mapped file."""
+    if is_mapped(path):
+        return Model.load_mapped(path)
+    return Model.load(path)
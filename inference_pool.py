@@ -0,0 +1,209 @@
+"""Process-pool inference backend.
+
+Each pool process loads the model once, then serves forward passes for one
+slot. A slot is a pair of ``multiprocessing.shared_memory`` blocks sized for
+``max_batch`` inputs and outputs, plus a pipe. Requests copy pixels into a
+free slot's input block and send only the batch size over the pipe, so image
+data is never pickled. The pool runs in separate interpreters, so inference
+for several requests proceeds on several cores while the web threads stay
+free for light routes such as ``/chat`` and ``/``.
+"""
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Longest wait between attempts to restart a slot whose process cannot start.
+RESTART_MAX_DELAY = 30.0
+
+
+def _serve(model_path, input_name, output_name, input_shape, classes, max_batch, features, conn):
+    """Pool process main loop: wait for a batch size, run the model on the shared input."""
+    from inference import load_model
+
+    model = load_model(model_path)
+    predict = model.predict_features if features else model.predict
+    inputs = shared_memory.SharedMemory(input_name)
+    outputs = shared_memory.SharedMemory(output_name)
+    x = np.ndarray((max_batch,) + tuple(input_shape), dtype=np.float32, buffer=inputs.buf)
+    y = np.ndarray((max_batch, classes), dtype=np.float32, buffer=outputs.buf)
+    predict(x[:1])
+    conn.send(None)
+    try:
+        while True:
+            try:
+                n = conn.recv()
+            except EOFError:
+                break
+            if n is None:
+                break
+            try:
+                y[:n] = predict(x[:n])
+                conn.send(None)
+            except Exception as e:
+                conn.send(f"{type(e).__name__}: {e}")
+    finally:
+        del x, y
+        inputs.close()
+        outputs.close()
+
+
+class _Slot:
+    def __init__(self, pool, index):
+        self.index = index
+        item = 4 * int(np.prod(pool.input_shape))
+        self.inputs = shared_memory.SharedMemory(create=True, size=pool.max_batch * item)
+        self.outputs = shared_memory.SharedMemory(create=True, size=pool.max_batch * pool.classes * 4)
+        self.x = np.ndarray((pool.max_batch,) + pool.input_shape, dtype=np.float32, buffer=self.inputs.buf)
+        self.y = np.ndarray((pool.max_batch, pool.classes), dtype=np.float32, buffer=self.outputs.buf)
+        self.process = None
+        self.conn = None
+
+    def start(self, pool):
+        if self.process is not None:
+            # Replacing a dead (or wedged) process.
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join(timeout=1)
+            self.conn.close()
+        parent, child = pool.context.Pipe()
+        self.process = pool.context.Process(
+            target=_serve,
+            args=(pool.model_path, self.inputs.name, self.outputs.name, pool.input_shape, pool.classes,
+                  pool.max_batch, pool.features, child),
+            name=f'inference-{self.index}',
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.conn = parent
+        # Wait for the model to load, so a started pool is a warm pool.
+        self.conn.recv()
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.kill()
+        del self.x, self.y
+        self.inputs.close()
+        self.inputs.unlink()
+        self.outputs.close()
+        self.outputs.unlink()
+
+
+class ProcessPool:
+    """Run ``predict(batch)`` on ``processes`` model-serving processes, one batch per process at a time.
+
+    By default the cores are shared evenly among ``workers`` processes (gunicorn
+    workers) that each run a pool. With ``features`` the processes run
+    ``Model.predict_features`` and ``classes`` is the full output width
+    (classes plus embedding size).
+    """
+
+    def __init__(self, model_path, input_shape, classes, processes=None, max_batch=16, features=False, workers=1):
+        self.model_path = os.path.abspath(model_path)
+        self.input_shape = tuple(input_shape)
+        self.classes = classes
+        self.features = features
+        self.processes = max(1, processes or (os.cpu_count() or 1) // max(1, workers))
+        self.max_batch = max(1, int(max_batch))
+        # Spawned, not forked: a gunicorn worker has threads running by the time the pool starts.
+        self.context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._pid = None
+        self._slots = []
+        self._free = queue.Queue()
+
+    def _ensure_started(self):
+        # Like the other background helpers, each gunicorn worker starts its own pool.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                slots = []
+                try:
+                    for i in range(self.processes):
+                        slots.append(_Slot(self, i))
+                        slots[-1].start(self)
+                except BaseException:
+                    for slot in slots:
+                        slot.stop()
+                    raise
+                self._slots = slots
+                self._free = queue.Queue()
+                for slot in slots:
+                    self._free.put(slot)
+                self._pid = os.getpid()
+                atexit.register(self.close)
+
+    def predict(self, batch):
+        """Return softmax probabilities for an (N, H, W, 3) batch, like ``Model.predict`` (or ``predict_features``)."""
+        self._ensure_started()
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.ndim == 3:
+            batch = batch[np.newaxis]
+        if batch.shape[1:] != self.input_shape:
+            raise ValueError(f"Expected input of shape {self.input_shape}, got {batch.shape[1:]}")
+        return np.concatenate([
+            self._run(batch[start:start + self.max_batch]) for start in range(0, len(batch), self.max_batch)
+        ])
+
+    def _run(self, chunk):
+        slot = self._free.get()
+        serving = True
+        try:
+            n = len(chunk)
+            slot.x[:n] = chunk
+            slot.conn.send(n)
+            error = slot.conn.recv()
+            if error is not None:
+                raise RuntimeError(f"Inference failed: {error}")
+            return slot.y[:n].copy()
+        except (EOFError, OSError) as e:
+            # The process died (e.g. killed for memory); replace it before freeing the slot.
+            serving = self._restart(slot)
+            raise RuntimeError("Inference process exited unexpectedly") from e
+        finally:
+            if serving:
+                self._free.put(slot)
+
+    def _restart(self, slot):
+        """Replace a slot's process; if that fails, keep retrying in the background and return False."""
+        try:
+            slot.start(self)
+            return True
+        except Exception:
+            threading.Thread(target=self._keep_restarting, args=(slot,), name=f'inference-restart-{slot.index}',
+                             daemon=True).start()
+            return False
+
+    def _keep_restarting(self, slot):
+        # The broken slot stays out of the free queue until it serves again.
+        delay = 1.0
+        while self._pid == os.getpid():
+            time.sleep(delay)
+            try:
+                slot.start(self)
+            except Exception:
+                delay = min(delay * 2, RESTART_MAX_DELAY)
+                continue
+            self._free.put(slot)
+            return
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        for slot in self._slots:
+            slot.stop()
+        self._slots = []
+        self._pid = None
@@ -0,0 +1,153 @@
+"""Asynchronous diagnosis jobs.
+
+``JobQueue`` accepts work from request handlers, returns a job id at once and
+drains the work on a small pool of background threads. Job state lives in a
+SQLite database (WAL mode) so that a poll can be answered by any gunicorn
+worker, not just the one that accepted the upload.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from process_local import LocalConnection, ProcessThreads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created);
+"""
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+# Long polls re-check the shared store this often for jobs owned by other workers.
+POLL_INTERVAL = 0.1
+
+
+class QueueFull(Exception):
+    """Too many jobs are waiting; the client should retry later."""
+
+
+class JobStore:
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = LocalConnection(path, 5.0, SCHEMA)
+
+    def create(self, job_id):
+        now = time.time()
+        self._db().execute(
+            'INSERT INTO jobs (id, status, created, updated) VALUES (?, ?, ?, ?)',
+            (job_id, QUEUED, now, now)
+        )
+
+    def update(self, job_id, status, result=None, error=None):
+        """Record a job's status; ``result`` is JSON-serializable or already-encoded JSON bytes."""
+        if result is not None and not isinstance(result, bytes):
+            result = json.dumps(result).encode('utf-8')
+        self._db().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?',
+            (status, result, error, time.time(), job_id)
+        )
+
+    def get(self, job_id):
+        row = self._db().execute(
+            'SELECT status, result, error, created, updated FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, error, created, updated = row
+        job = {"id": job_id, "status": status, "created": created, "updated": updated}
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def purge(self):
+        """Forget jobs older than ``ttl``."""
+        self._db().execute('DELETE FROM jobs WHERE created < ?', (time.time() - self.ttl,))
+
+
+class JobQueue:
+    """Run ``handler(payload)`` on background threads and record the outcome in ``store``."""
+
+    def __init__(self, handler, store, workers=2, max_pending=256):
+        self.handler = handler
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue = queue.Queue()
+        self._events = {}
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._threads = ProcessThreads(self._run, 'job-worker', workers, reset=self._new_process)
+
+    def _new_process(self):
+        self._queue = queue.Queue()
+        self._events = {}
+
+    def depth(self):
+        """Number of jobs waiting for a worker in this process."""
+        return self._queue.qsize()
+
+    def submit(self, payload):
+        """Queue ``payload`` and return its job id."""
+        self._threads.ensure_started()
+        if self._queue.qsize() >= self.max_pending:
+            raise QueueFull("Too many pending jobs, please retry shortly")
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id)
+        with self._lock:
+            self._events[job_id] = threading.Event()
+            self._submitted += 1
+            if self._submitted % 100 == 0:
+                self.store.purge()
+        self._queue.put((job_id, payload))
+        return job_id
+
+    def _run(self):
+        while True:
+            job_id, payload = self._queue.get()
+            try:
+                self.store.update(job_id, RUNNING)
+                self.store.update(job_id, DONE, result=self.handler(payload))
+            except Exception as e:
+                try:
+                    self.store.update(job_id, FAILED, error=str(e))
+                except sqlite3.Error:
+                    # The store is unavailable; the job is left unfinished, but this worker must keep going.
+                    pass
+            finally:
+                with self._lock:
+                    event = self._events.pop(job_id, None)
+                if event is not None:
+                    event.set()
+
+    def wait(self, job_id, timeout):
+        """Return the job once finished or after ``timeout`` seconds, whichever is first."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+            return self.store.get(job_id)
+        job = self.store.get(job_id)
+        while job is not None and job["status"] not in FINISHED and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            job = self.store.get(job_id)
+        return job
@@ -0,0 +1,98 @@
+"""Disease knowledge base compiled into tables aligned with the model output.
+
+``KnowledgeBase`` checks at construction time that every class label has a
+treatment entry and that the healthy labels are known classes. It then
+freezes the treatments, serializes each one to JSON once, and precomputes a
+healthy bitmask, so resolving a prediction is a single tuple index.
+"""
+import json
+import re
+from collections import namedtuple
+from types import MappingProxyType
+
+import numpy as np
+
+Condition = namedtuple('Condition', 'index label crop healthy treatment payload label_json')
+
+# Shortened spellings used by earlier versions of the treatment table.
+LEGACY_ALIASES = {
+    "Corn_(maize)_Cercospora_leaf_spot": "Corn_(maize)_Cercospora_leaf_spot_Gray_leaf_spot",
+    "Grape_Leaf_blight": "Grape_Leaf_blight_(Isariopsis_Leaf_Spot)",
+    "Orange_Haunglongbing": "Orange_Haunglongbing_(Citrus_greening)",
+    "Tomato_Yellow_Leaf_Curl_Virus": "Tomato_Tomato_Yellow_Leaf_Curl_Virus",
+    "Tomato_mosaic_virus": "Tomato_Tomato_mosaic_virus",
+}
+
+
+def normalize_label(label):
+    """Spelling-insensitive form of a label, e.g. 'Pepper,_bell_healthy' -> 'pepperbellhealthy'."""
+    return re.sub(r'[^a-z0-9]', '', label.lower())
+
+
+def crop_of(label):
+    """Crop name at the start of a class label, e.g. 'Corn_(maize)_Common_rust' -> 'Corn'."""
+    return label.split('_', 1)[0].rstrip(',')
+
+
+def freeze(value):
+    """Recursively convert dicts and lists into read-only mappings and tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class KnowledgeBase:
+    def __init__(self, class_names, treatments, healthy_labels, aliases=LEGACY_ALIASES):
+        missing = [label for label in class_names if label not in treatments]
+        unknown = [label for label in treatments if label not in class_names]
+        not_classes = [label for label in healthy_labels if label not in class_names]
+        if missing or unknown or not_classes:
+            raise ValueError(
+                f"Knowledge base does not match class_names: missing treatments {missing}, "
+                f"unknown treatments {unknown}, unknown healthy labels {not_classes}"
+            )
+
+        healthy = set(healthy_labels)
+        self.labels = tuple(class_names)
+        self.healthy_mask = np.array([label in healthy for label in class_names], dtype=bool)
+        self.healthy_mask.setflags(write=False)
+        self.conditions = tuple(
+            Condition(
+                index=i,
+                label=label,
+                crop=crop_of(label),
+                healthy=label in healthy,
+                treatment=freeze(treatments[label]),
+                payload=json.dumps(treatments[label], separators=(',', ':')).encode('utf-8'),
+                label_json=json.dumps(label).encode('utf-8'),
+            )
+            for i, label in enumerate(class_names)
+        )
+        self._by_label = {}
+        for condition in self.conditions:
+            self._by_label[condition.label] = condition
+            self._by_label[normalize_label(condition.label)] = condition
+        for alias, label in aliases.items():
+            if label in self._by_label:
+                self._by_label[normalize_label(alias)] = self._by_label[label]
+
+    def __len__(self):
+        return len(self.conditions)
+
+    def __getitem__(self, index):
+        return self.conditions[index]
+
+    def lookup(self, label):
+        """Find a condition by label, tolerating legacy spellings; None if unknown."""
+        return self._by_label.get(label) or self._by_label.get(normalize_label(label))
+
+    def aliases(self):
+        """Normalised spellings (of labels and legacy aliases) mapped to their canonical label."""
+        return {key: condition.label for key, condition in self._by_label.items() if key != condition.label}
+
+    def check_model(self, labels):
+        """Raise if a model's output labels are not aligned with this knowledge base."""
+        if labels is not None and tuple(labels) != self.labels:
+            raise ValueError("Model output labels do not match class_names")
@@ -0,0 +1,100 @@
+"""Versioned bundle of the treatment and FAQ data for answering lookups in the browser.
+
+The bundle holds every treatment, the label aliases, the healthy labels and
+the FAQ together with its BM25 index as built by ``FaqIndex``: vocabulary,
+CSR postings and weights. ``static/js/knowledge.js`` keeps it in
+localStorage and answers chat questions and treatment lookups without a
+round trip. The version is a hash of the content, so the bundle URL is
+served as immutable. There is one bundle per translation catalog: its
+treatments and FAQ texts are translated, while the search index stays that
+of the English FAQ.
+
+Every version served is also saved to disk. A client holding an older
+version can then fetch a delta instead of the whole bundle. The delta is
+per key for treatments and aliases. For the FAQ and the healthy list, a
+changed section is sent whole, because BM25 weights depend on the entire
+collection.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from faq_index import STOPWORDS
+
+VERSION = re.compile(r'^[0-9a-f]{16}$')
+KEYED_SECTIONS = ('treatments', 'aliases')
+WHOLE_SECTIONS = ('healthy', 'faq')
+
+
+def encode(document):
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False, sort_keys=True).encode('utf-8')
+
+
+def build_bundle(knowledge_base, faq_index, catalog=None):
+    """Return the bundle dict in ``catalog``'s language (English if None), with ``version`` set from its content."""
+    localize = catalog.localize if catalog is not None else (lambda value: value)
+    vocabulary = sorted(faq_index.vocabulary, key=faq_index.vocabulary.get)
+    bundle = {
+        "language": catalog.language if catalog is not None else 'en',
+        "treatments": {c.label: localize(json.loads(c.payload)) for c in knowledge_base},
+        "healthy": [c.label for c in knowledge_base if c.healthy],
+        "aliases": knowledge_base.aliases(),
+        "faq": {
+            "entries": [localize([entry["question"], entry["answer"]]) for entry in faq_index.entries],
+            "vocabulary": vocabulary,
+            "indptr": faq_index.indptr.tolist(),
+            "docs": faq_index.doc_ids.tolist(),
+            "weights": [round(float(w), 4) for w in faq_index.weights],
+            "min_score": faq_index.min_score,
+            "stopwords": sorted(STOPWORDS),
+        },
+    }
+    bundle["version"] = hashlib.sha256(encode(bundle)).hexdigest()[:16]
+    return bundle
+
+
+def delta(old, new):
+    """Changes that turn bundle ``old`` into ``new``."""
+    changes = {"from": old["version"], "version": new["version"]}
+    for section in KEYED_SECTIONS:
+        updated = {key: value for key, value in new[section].items() if old[section].get(key) != value}
+        removed = sorted(key for key in old[section] if key not in new[section])
+        if updated or removed:
+            changes[section] = {"set": updated, "remove": removed}
+    for section in WHOLE_SECTIONS:
+        if old[section] != new[section]:
+            changes[section] = new[section]
+    return changes
+
+
+class BundleStore:
+    """Snapshots of every bundle version served, as ``<version>.json`` files."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def save(self, bundle):
+        path = os.path.join(self.root, f"{bundle['version']}.json")
+        if os.path.exists(path):
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(encode(bundle))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def load(self, version):
+        """A saved bundle, or None for an unknown (or malformed) version."""
+        if not VERSION.match(version or ''):
+            return None
+        try:
+            with open(os.path.join(self.root, f'{version}.json'), 'rb') as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
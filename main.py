@@ -1,17 +1,105 @@
-from flask import Flask, request, render_template, jsonify, url_for
+from flask import (Flask, Request, Response, g, request, render_template, jsonify, url_for, stream_with_context,
+                   send_from_directory)
 from flask_cors import CORS
-from PIL import Image
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
 import numpy as np
+import json
+import math
 import os
+import time
+from datetime import datetime, timezone
 
-app = Flask(__name__)
-CORS(app)
+from augment import predict_averaged, source_size, tta_batch
+from batching import MicroBatcher
+from derivatives import Derivatives
+from faq_index import FaqIndex
+from hierarchy import CropHierarchy, downsample
+from http_cache import CachedBody, dynamic_response, etag_matches, file_fingerprint, not_modified
+from inference import load_model
+from inference_pool import ProcessPool
+from jobs import JobQueue, JobStore, QueueFull
+from knowledge_base import KnowledgeBase
+from knowledge_bundle import BundleStore, build_bundle, delta, encode
+from metrics import Registry
+from outbreaks import GRANULARITIES, OutbreakStore
+from prediction_cache import PredictionCache, content_hash, perceptual_hash
+from preprocess import DECODE_ERRORS, UploadError, UploadTooLarge, decode_image, read_upload
+from resumable import (CHECKSUM_ALGORITHMS, TUS_VERSION, ChecksumMismatch, OffsetMismatch, ResumableUploads,
+                       UploadBusy, UploadNotFound, parse_metadata)
+from similar_cases import CaseIndex
+from survey import SurveySummary, chunked, iter_survey
+from tiling import TileGrid, decode_field
+from translations import load_catalogs
+from upload_store import UploadStore, guess_extension
+
+class AgriPalRequest(Request):
+    @property
+    def max_content_length(self):
+        # Field surveys are far larger than a single photo upload.
+        if self.endpoint == 'batch_predict':
+            return app.config['MAX_SURVEY_BYTES']
+        return super().max_content_length
+
+# Databases, indexes and caches default to files under the instance folder
+app = Flask(__name__, instance_path=os.environ.get('APP_INSTANCE_PATH'))
+app.request_class = AgriPalRequest
+# Browser tus clients need to read the resumable-upload headers
+CORS(app, expose_headers=['Location', 'Upload-Offset', 'Upload-Length', 'Tus-Resumable', 'Tus-Version',
+                          'Tus-Extension', 'Tus-Max-Size', 'Tus-Checksum-Algorithm'])
 
 # Configure upload folder
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Compiled templates persist across restarts; compiled ones stay in memory per process
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja'))
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+# Static URLs carry ?v=<content hash>, so browsers may keep them forever
+STATIC_IMMUTABLE = 'public, max-age=31536000, immutable'
+HOME_CACHE_CONTROL = f"public, max-age={int(os.environ.get('HOME_MAX_AGE', 300))}"
+
+# Upload limits, enforced while the request body is still streaming
+app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('MAX_UPLOAD_BYTES', 20 * 1024 * 1024))
+app.config['MAX_IMAGE_PIXELS'] = int(os.environ.get('MAX_IMAGE_PIXELS', 64_000_000))
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_BYTES'] + 64 * 1024
+app.config['MAX_SURVEY_BYTES'] = int(os.environ.get('MAX_SURVEY_BYTES', 4 * 1024 ** 3))
+app.config['MAX_SURVEY_FILES'] = int(os.environ.get('MAX_SURVEY_FILES', 5000))
+app.config['SURVEY_CHUNK_SIZE'] = int(os.environ.get('SURVEY_CHUNK_SIZE', 32))
+# Field photos are tiled at this working resolution; only leafy tiles are classified
+app.config['FIELD_MAX_SIDE'] = int(os.environ.get('FIELD_MAX_SIDE', 2048))
+app.config['FIELD_MIN_COVERAGE'] = float(os.environ.get('FIELD_MIN_COVERAGE', 0.3))
+app.config['FIELD_MAX_TILES'] = int(os.environ.get('FIELD_MAX_TILES', 256))
+
+# Metrics shared by all workers through a memory-mapped file, served at /metrics
+metrics = Registry(os.environ.get('METRICS_PATH'), enabled=os.environ.get('METRICS_ENABLED', '1') == '1')
+stage_seconds = metrics.histogram(
+    'agripal_stage_duration_seconds', "Time spent in each stage of the diagnosis pipeline",
+    ('stage',), [('receive',), ('store',), ('cache',), ('decode',), ('inference',), ('render',)]
+)
+cache_lookups = metrics.counter(
+    'agripal_prediction_cache_lookups_total', "Prediction cache lookups by outcome",
+    ('result',), [('hit',), ('miss',)]
+)
+chat_queries = metrics.counter(
+    'agripal_chat_queries_total', "Chatbot queries by outcome",
+    ('result',), [('answered',), ('missed',)]
+)
+upload_bytes = metrics.counter('agripal_upload_bytes_total', "Bytes of image data received")
+uploads_total = metrics.counter('agripal_uploads_total', "Images received")
+queue_depth = metrics.gauge(
+    'agripal_queue_depth', "Work waiting in in-process queues",
+    ('queue',), [('jobs',), ('batcher',)]
+)
+hierarchical_answers = metrics.counter(
+    'agripal_hierarchical_predictions_total', "Hierarchical predictions by the stage that gave the answer",
+    ('stage',), [('crop',), ('disease',)]
+)
+
 # Class names for plant diseases
 class_names = [
     "Apple_Apple_scab", "Apple_Black_rot", "Apple_Cedar_apple_rust", "Apple_healthy",
@@ -184,7 +272,7 @@ disease_treatments = {
             },
             "severity": "None"
         },
-        "Corn_(maize)_Cercospora_leaf_spot": {
+        "Corn_(maize)_Cercospora_leaf_spot_Gray_leaf_spot": {
             "name": "Gray Leaf Spot",
             "description": "Fungal disease causing rectangular gray lesions on corn leaves",
             "treatment": [
@@ -316,7 +404,7 @@ disease_treatments = {
             },
             "severity": "Severe"
         },
-        "Grape_Leaf_blight": {
+        "Grape_Leaf_blight_(Isariopsis_Leaf_Spot)": {
             "name": "Grape Leaf Blight",
             "description": "Fungal disease causing brown spots with dark borders",
             "treatment": [
@@ -360,7 +448,7 @@ disease_treatments = {
             },
             "severity": "None"
         },
-        "Orange_Haunglongbing": {
+        "Orange_Haunglongbing_(Citrus_greening)": {
             "name": "Citrus Greening",
             "description": "Bacterial disease spread by Asian citrus psyllid",
             "treatment": [
@@ -426,7 +514,7 @@ disease_treatments = {
             },
             "severity": "None"
         },
-        "Pepper_bell_Bacterial_spot": {
+        "Pepper,_bell_Bacterial_spot": {
             "name": "Pepper Bacterial Spot",
             "description": "Bacterial disease causing spots on leaves and fruit",
             "treatment": [
@@ -448,7 +536,7 @@ disease_treatments = {
             },
             "severity": "High"
         },
-        "Pepper_bell_healthy": {
+        "Pepper,_bell_healthy": {
             "name": "Healthy Bell Pepper",
             "description": "Plant appears healthy with no visible disease symptoms",
             "treatment": [
@@ -800,7 +888,7 @@ disease_treatments = {
             },
             "severity": "High"
         },
-        "Tomato_Yellow_Leaf_Curl_Virus": {
+        "Tomato_Tomato_Yellow_Leaf_Curl_Virus": {
             "name": "Tomato Yellow Leaf Curl Virus",
             "description": "Viral disease causing yellowing, curling leaves and stunted growth",
             "treatment": [
@@ -822,7 +910,7 @@ disease_treatments = {
             },
             "severity": "Severe"
         },
-        "Tomato_mosaic_virus": {
+        "Tomato_Tomato_mosaic_virus": {
             "name": "Tomato Mosaic Virus",
             "description": "Viral disease causing mottled and distorted leaves",
             "treatment": [
@@ -876,10 +964,122 @@ healthy_plants = [
     "Potato_healthy", "Raspberry_healthy", "Soybean_healthy", "Strawberry_healthy", "Tomato_healthy"
 ]
 
-# Directory to save uploaded images
-UPLOAD_FOLDER = 'static/uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Uploads are stored once per unique image under static/uploads/ab/cd/<sha256>.<ext>
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    max_bytes=int(os.environ.get('UPLOAD_STORE_MAX_BYTES', 2 * 1024 ** 3)),
+    max_age=float(os.environ.get('UPLOAD_STORE_MAX_AGE_DAYS', 30)) * 24 * 3600,
+    retention_interval=float(os.environ.get('UPLOAD_RETENTION_INTERVAL', 3600))
+)
+
+# Resized WebP/JPEG copies of uploads for the result page, made in the background
+derivatives = Derivatives(
+    app.config['UPLOAD_FOLDER'],
+    widths=[int(w) for w in os.environ.get('DERIVATIVE_WIDTHS', '320,640,1280').split(',')],
+    max_pixels=app.config['MAX_IMAGE_PIXELS']
+)
+
+# Validated at import: one entry per model output index
+knowledge_base = KnowledgeBase(class_names, disease_treatments, healthy_plants)
+
+# Load the NumPy classifier once per worker (see convert_model.py); a memory-mapped
+# file from quantize_model.py is shared by all workers through the page cache
+MODEL_PATH = os.environ.get('MODEL_PATH', 'plant_diseases_model.npz')
+model = load_model(MODEL_PATH) if os.path.exists(MODEL_PATH) else None
+if model is not None:
+    knowledge_base.check_model(model.labels)
+
+# Extra model variants for the per-request "ensemble" mode (comma-separated .npz paths)
+ensemble = [model] if model is not None else []
+for path in filter(None, os.environ.get('ENSEMBLE_MODEL_PATHS', '').split(',') if model is not None else ()):
+    member = load_model(path.strip())
+    knowledge_base.check_model(member.labels)
+    if member.input_shape != model.input_shape:
+        raise ValueError(f"Ensemble model {path} expects input {member.input_shape}, not {model.input_shape}")
+    ensemble.append(member)
+ENSEMBLE_VERSION = content_hash(','.join(m.version for m in ensemble).encode())[:16]
+
+# Crop groups of the classes; a client's "crop" hint restricts the answer to one crop
+hierarchy = CropHierarchy(knowledge_base, threshold=float(os.environ.get('CROP_THRESHOLD', 0.9)))
+
+# Small crop/health model (see train_crop_model.py) for the "hierarchical" mode:
+# confidently healthy leaves are answered without running the full classifier
+CROP_MODEL_PATH = os.environ.get('CROP_MODEL_PATH', 'crop_model.npz')
+crop_model = load_model(CROP_MODEL_PATH) if model is not None and os.path.exists(CROP_MODEL_PATH) else None
+if crop_model is not None and crop_model.labels != hierarchy.stage_labels:
+    raise ValueError(f"Crop model {CROP_MODEL_PATH} labels do not match the crop groups: {hierarchy.stage_labels}")
+
+# "tta" averages augmented views of the image, "ensemble" averages the model variants
+PREDICT_MODES = (('standard', 'tta') + (('ensemble',) if len(ensemble) > 1 else ())
+                 + (('hierarchical',) if crop_model is not None else ()))
+DEFAULT_PREDICT_MODE = os.environ.get('DEFAULT_PREDICT_MODE', 'standard')
+if DEFAULT_PREDICT_MODE not in PREDICT_MODES:
+    DEFAULT_PREDICT_MODE = 'standard'
+
+# Penultimate-layer embeddings of diagnosed uploads, searched by /api/v1/similar;
+# one index per model version, since embeddings of different models do not compare
+case_index = CaseIndex(
+    os.path.join(os.environ.get('CASE_INDEX_PATH', os.path.join(app.instance_path, 'cases')), model.version[:16]),
+    model.embedding_size,
+    lists=int(os.environ.get('CASE_INDEX_LISTS', 256)),
+    probes=int(os.environ.get('CASE_INDEX_PROBES', 8))
+) if model is not None and os.environ.get('CASE_INDEX_ENABLED', '1') == '1' else None
+
+# Where forward passes run: "thread" (in this process) or "process" (a pool of
+# inference processes fed through shared memory, so they run outside the GIL)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'thread')
+inference_pool = ProcessPool(
+    MODEL_PATH,
+    model.input_shape,
+    len(class_names) + (model.embedding_size if case_index is not None else 0),
+    processes=int(os.environ.get('INFERENCE_PROCESSES', 0)) or None,
+    max_batch=int(os.environ.get('BATCH_MAX_SIZE', 16)),
+    features=case_index is not None,
+    # Every gunicorn worker runs its own pool; the default matches gunicorn.conf.py.
+    workers=int(os.environ.get('WEB_CONCURRENCY', 2))
+) if model is not None and INFERENCE_BACKEND == 'process' else None
+# Rows are the class probabilities, followed by the embedding when the case index is on
+if inference_pool is not None:
+    run_features = inference_pool.predict
+elif model is not None:
+    run_features = model.predict_features if case_index is not None else model.predict
+else:
+    run_features = None
+
+def run_model(batch):
+    """Class probabilities for a batch on the configured backend."""
+    return run_features(batch)[:, :len(class_names)]
+
+# Concurrent /predict calls are merged into one forward pass
+batcher = MicroBatcher(
+    run_features,
+    window_ms=float(os.environ.get('BATCH_WINDOW_MS', 10)),
+    max_batch=int(os.environ.get('BATCH_MAX_SIZE', 16)),
+    workers=inference_pool.processes if inference_pool is not None else 1
+) if model is not None else None
+
+# Results of previous uploads, shared across workers through SQLite
+prediction_cache = PredictionCache(
+    os.environ.get('PREDICTION_CACHE_PATH', os.path.join(app.instance_path, 'predictions.sqlite3')),
+    namespace=model.version,
+    max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 50000)),
+    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 30 * 24 * 3600))
+) if model is not None else None
+USE_PERCEPTUAL_HASH = os.environ.get('PREDICTION_CACHE_PHASH', '0') == '1'
+
+# Every diagnosis, with per-location outbreak counts maintained on insert
+outbreak_store = OutbreakStore(
+    os.environ.get('OUTBREAK_STORE_PATH', os.path.join(app.instance_path, 'outbreaks.sqlite3')),
+    flush_interval=float(os.environ.get('OUTBREAK_FLUSH_INTERVAL', 1.0))
+)
+
+# Shown when no converted model has been deployed
+maintenance_info = {
+    "name": "AI Analysis (Maintenance)",
+    "description": "The AI detection engine is currently offline to save resources. Use the chatbot below for help!",
+    "treatment": ["Ensure proper watering", "Check soil pH", "Monitor for pests"],
+    "severity": "N/A"
+}
 
 # FAQ for chatbot
 faq = [
@@ -1028,48 +1228,872 @@ faq = [
     }
 ]
 
+# Fixed chatbot replies, kept here so compile_translations.py can find them
+CHAT_REPLIES = {
+    "empty": "Please ask a question!",
+    "unknown": "I'm sorry, I don't have information on that. Can you provide more details?",
+}
+
+# Built once per worker; answers /chat queries without scanning every entry
+faq_index = FaqIndex(faq)
+
+# Offline translation catalogs (see compile_translations.py); English is always available
+catalogs = load_catalogs(os.environ.get('TRANSLATIONS_PATH', os.path.join(app.root_path, 'translations')))
+LANGUAGES = [(code, catalog.name) for code, catalog in catalogs.items()]
+# The Google Translate widget: "auto" shows it only while no catalog is installed, "1" always
+# (for languages without a catalog), "0" never
+TRANSLATE_WIDGET = os.environ.get('TRANSLATE_WIDGET', 'auto')
+show_translate_widget = TRANSLATE_WIDGET == '1' or (TRANSLATE_WIDGET == 'auto' and len(catalogs) == 1)
+# Treatments are translated once per language, not per request
+localized_treatments = {code: [catalog.localize(c.treatment) for c in knowledge_base]
+                        for code, catalog in catalogs.items()}
+app.jinja_env.globals['_'] = lambda text: text
+
+# Treatment JSON is serialized (and compressed) once; API responses splice in these bytes
+treatment_bodies = [CachedBody(condition.payload, 'application/json') for condition in knowledge_base]
+TREATMENT_CACHE_CONTROL = 'public, max-age=86400'
+
+# Treatments and the FAQ with its search index, as one versioned bundle per language that
+# browsers keep locally; every version is saved so older copies can be brought up to date with a delta
+knowledge_bundles = {code: build_bundle(knowledge_base, faq_index, catalog) for code, catalog in catalogs.items()}
+bundle_store = BundleStore(os.environ.get('KNOWLEDGE_BUNDLE_PATH', os.path.join(app.instance_path, 'knowledge')))
+bundles_by_version = {bundle["version"]: bundle for bundle in knowledge_bundles.values()}
+knowledge_bodies = {}
+for version, bundle in bundles_by_version.items():
+    bundle_store.save(bundle)
+    knowledge_bodies[version] = CachedBody(encode(bundle), 'application/json', etag=version)
+knowledge_deltas = {}
+
+# pid of the process that last ran warm_up(); forked workers must warm up again
+warm_pid = None
+
+def warm_up(start_pool=True):
+    """Compile templates, exercise the chat index and run a dummy inference; returns seconds taken.
+
+    A preloading master passes ``start_pool=False``: pool processes belong to the workers.
+    """
+    global warm_pid
+    started = time.perf_counter()
+    app.jinja_env.get_template('result.html')
+    with app.test_request_context('/'):
+        for language in catalogs:
+            rendered_page('index.html', language)
+    faq_index.search("how do I treat blight on tomato leaves")
+    if model is not None:
+        # A full-size batch touches every weight page and sizes the allocator's arenas.
+        model.predict(np.zeros((batcher.max_batch,) + model.input_shape, dtype=np.float32))
+        for member in ensemble[1:] + ([crop_model] if crop_model is not None else []):
+            member.predict(np.zeros((1,) + member.input_shape, dtype=np.float32))
+        if inference_pool is not None and start_pool:
+            inference_pool.predict(np.zeros((1,) + model.input_shape, dtype=np.float32))
+    warm_pid = os.getpid()
+    return time.perf_counter() - started
+
+static_versions = {}
+
+def static_version(filename):
+    """Content fingerprint of a static file ('' if missing), computed once per process."""
+    version = static_versions.get(filename)
+    if version is None:
+        path = safe_join(app.static_folder, filename)
+        version = file_fingerprint(path) if path and os.path.isfile(path) else ''
+        static_versions[filename] = version
+    return version
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # Uploads are already named by their content hash.
+    if endpoint == 'static' and 'v' not in values and not values.get('filename', '').startswith('uploads/'):
+        version = static_version(values.get('filename', ''))
+        if version:
+            values['v'] = version
+
+@app.after_request
+def cache_static_files(response):
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        filename = (request.view_args or {}).get('filename', '')
+        if filename.startswith('uploads/') or request.args.get('v') == static_version(filename) != '':
+            response.headers['Cache-Control'] = STATIC_IMMUTABLE
+    return response
+
+def request_language():
+    """Catalog code for this request: ?lang= or a form field, then the cookie, then Accept-Language."""
+    for language in (request.values.get('lang'), request.cookies.get('lang')):
+        if language in catalogs:
+            return language
+    return request.accept_languages.best_match(list(catalogs)) or 'en'
+
+def page_context(language):
+    """Template variables for a page in ``language``."""
+    return {"_": catalogs[language].gettext, "lang": language, "languages": LANGUAGES,
+            "translate_widget": show_translate_widget}
+
+rendered_pages = {}
+
+def rendered_page(name, language='en'):
+    """Template ``name`` rendered once per process and language, with its compressed encodings and ETag."""
+    page = rendered_pages.get((name, language))
+    if page is None:
+        rendered = datetime.fromtimestamp(int(time.time()), timezone.utc)
+        html = render_template(name, crops=hierarchy.crops, **page_context(language))
+        page = CachedBody(html.encode('utf-8'), 'text/html', last_modified=rendered)
+        rendered_pages[(name, language)] = page
+    return page
+
 @app.route('/')
 def home():
-    """Render the home page with the upload form and chatbot."""
-    return render_template('index.html')
+    """Serve the pre-rendered home page, in the visitor's language, with the upload form and chatbot."""
+    language = request_language()
+    response = rendered_page('index.html', language).response(request, HOME_CACHE_CONTROL)
+    response.vary.update(('Accept-Language', 'Cookie'))
+    if request.args.get('lang') == language:
+        response.set_cookie('lang', language, max_age=365 * 24 * 3600, samesite='Lax')
+    return response
+
+def image_sources(relative):
+    """``srcset`` strings for an upload's derivatives, and a mid-size JPEG fallback."""
+    def srcset(fmt):
+        return ', '.join(f"{url_for('media', name=name)} {width}w" for name, width in derivatives.srcset(relative, fmt))
+    fallback = derivatives.srcset(relative, 'jpg')[len(derivatives.widths) // 2][0]
+    return {"webp": srcset('webp'), "jpg": srcset('jpg'), "src": url_for('media', name=fallback)}
+
+def html_response(html):
+    """A rendered page, gzip-compressed for clients on slow links."""
+    return dynamic_response(request, html.encode('utf-8'), 'text/html')
+
+def record_upload(data):
+    uploads_total.inc()
+    upload_bytes.inc(amount=len(data))
+
+def record_case(data, key, probabilities, embedding, location):
+    """Add a freshly classified upload to the similar-case index."""
+    if case_index is not None and len(embedding):
+        index = int(np.argmax(probabilities))
+        image = upload_store.relative_path(key, guess_extension(data))
+        case_index.add(key, embedding, index, probabilities[index], image, location)
+
+def prediction_mode(mode, crop):
+    # A known crop makes stage one unnecessary.
+    return 'standard' if mode == 'hierarchical' and crop else mode
+
+def prediction_key(key, mode='standard', crop=None):
+    """Prediction-cache key for an upload's content hash in ``mode``; standard results use the hash itself."""
+    mode = prediction_mode(mode, crop)
+    if mode == 'tta':
+        return f'{key}:tta'
+    if mode == 'ensemble':
+        return f'{key}:ensemble-{ENSEMBLE_VERSION}'
+    if mode == 'hierarchical':
+        # Retraining the stage-one model or retuning CROP_THRESHOLD changes the answers.
+        return f'{key}:hierarchical-{crop_model.version}-{hierarchy.threshold:g}'
+    return key
+
+def classify(data, key, mode='standard', crop=None, location=None):
+    """Return class probabilities for uploaded image bytes, using the cache when possible.
+
+    ``key`` is the content hash of ``data``; mode-specific suffixes only apply to the prediction cache.
+    A known ``crop`` restricts the answer to that crop's classes (and makes stage one unnecessary).
+    Uploads that go through the full classifier are added to the similar-case index.
+    """
+    mode = prediction_mode(mode, crop)
+    cache_key = prediction_key(key, mode)
+    max_pixels = app.config['MAX_IMAGE_PIXELS']
+    with stage_seconds.time('cache'):
+        phash = perceptual_hash(data, max_pixels) if USE_PERCEPTUAL_HASH and mode == 'standard' else None
+        probabilities = prediction_cache.get(cache_key, phash)
+    cache_lookups.inc('miss' if probabilities is None else 'hit')
+    if probabilities is None:
+        if mode == 'tta':
+            # Every view is cut from one decode and classified in a single batched call.
+            with stage_seconds.time('decode'):
+                image = decode_image(data, source_size(model.input_size), max_pixels)
+                batch = tta_batch(image, model.input_size)
+            with stage_seconds.time('inference'):
+                probabilities = predict_averaged([run_model], batch)
+        elif mode == 'ensemble':
+            with stage_seconds.time('decode'):
+                pixels = decode_image(data, model.input_size, max_pixels)
+            with stage_seconds.time('inference'):
+                probabilities = predict_averaged([run_model] + [m.predict for m in ensemble[1:]], pixels[np.newaxis])
+        elif mode == 'hierarchical':
+            with stage_seconds.time('decode'):
+                pixels = decode_image(data, model.input_size, max_pixels)
+                thumbnail = downsample(pixels, crop_model.input_size)
+            with stage_seconds.time('inference'):
+                probabilities, stage_crop = hierarchy.stage_one(crop_model.predict(thumbnail[np.newaxis])[0])
+                hierarchical_answers.inc('disease' if probabilities is None else 'crop')
+                if probabilities is None:
+                    row = batcher.submit(pixels)
+                    probabilities = row[:len(class_names)]
+                    if stage_crop is not None:
+                        probabilities = hierarchy.restrict(probabilities, stage_crop)
+                    record_case(data, key, probabilities, row[len(class_names):], location)
+        else:
+            with stage_seconds.time('decode'):
+                pixels = decode_image(data, model.input_size, max_pixels)
+            with stage_seconds.time('inference'):
+                row = batcher.submit(pixels)
+            probabilities = row[:len(class_names)]
+            record_case(data, key, probabilities, row[len(class_names):], location)
+        prediction_cache.put(cache_key, probabilities, phash)
+    if crop:
+        probabilities = hierarchy.restrict(probabilities, crop)
+    return probabilities
+
+def classify_many(items):
+    """Probabilities (or the UploadError) for each (data, key) pair; cache misses run as one batch.
+
+    A bad image only fails its own entry.
+    """
+    with stage_seconds.time('cache'):
+        results = [prediction_cache.get(key) for _, key in items]
+    pixels, positions = [], []
+    for i, (data, key) in enumerate(items):
+        cache_lookups.inc('miss' if results[i] is None else 'hit')
+        if results[i] is not None:
+            continue
+        try:
+            with stage_seconds.time('decode'):
+                pixels.append(decode_image(data, model.input_size, app.config['MAX_IMAGE_PIXELS']))
+            positions.append(i)
+        except UploadError as e:
+            results[i] = e
+        except DECODE_ERRORS as e:
+            results[i] = UploadError(f"The image could not be decoded: {e}")
+    if pixels:
+        with stage_seconds.time('inference'):
+            batch = run_model(np.stack(pixels))
+        for i, row in zip(positions, batch):
+            results[i] = row
+            prediction_cache.put(items[i][1], row)
+    return results
+
+def prediction_body(probabilities, k=3, location=None, image_url=None):
+    """Top-k classes and the best one's treatment as JSON bytes, assembled from pre-serialized fragments."""
+    top = np.argsort(probabilities)[::-1][:k]
+    best = knowledge_base[int(top[0])]
+    predictions = b','.join(
+        b'{"label":%s,"probability":%s}' % (knowledge_base[int(i)].label_json, repr(float(probabilities[i])).encode())
+        for i in top
+    )
+    parts = [
+        b'{"label":', best.label_json,
+        b',"healthy":', b'true' if best.healthy else b'false',
+        b',"confidence":', repr(float(probabilities[top[0]])).encode(),
+        b',"predictions":[', predictions,
+        b'],"treatment":', best.payload,
+    ]
+    if location:
+        parts += [b',"location":', json.dumps(location).encode('utf-8')]
+    if image_url:
+        parts += [b',"image_url":', json.dumps(image_url).encode('utf-8')]
+    parts.append(b'}')
+    return b''.join(parts)
+
+def record_diagnosis(key, location, probabilities):
+    """Count a diagnosis towards outbreaks; the store ignores a photo already counted at that location."""
+    index = int(np.argmax(probabilities))
+    outbreak_store.record(key, location, index, probabilities[index])
+
+def run_job(payload):
+    """Diagnose an upload accepted by /api/v1/jobs, reading it back from the upload store."""
+    try:
+        data = upload_store.read(payload["stored"])
+    except FileNotFoundError:
+        raise UploadError("The upload expired before it was diagnosed")
+    probabilities = classify(data, payload["key"], payload["mode"], payload["crop"], payload["location"])
+    record_diagnosis(payload["key"], payload["location"], probabilities)
+    return prediction_body(probabilities, location=payload["location"], image_url=payload["image_url"])
+
+# Background diagnosis for /api/v1/jobs; state is shared across workers via SQLite
+job_queue = JobQueue(
+    run_job,
+    JobStore(
+        os.environ.get('JOB_STORE_PATH', os.path.join(app.instance_path, 'jobs.sqlite3')),
+        ttl=float(os.environ.get('JOB_TTL', 3600))
+    ),
+    workers=int(os.environ.get('JOB_WORKERS', 2)),
+    max_pending=int(os.environ.get('JOB_MAX_PENDING', 256))
+)
+
+def submit_job(data, mode, crop, location):
+    """Store an upload and queue it for background diagnosis; returns the job id.
+
+    Only the stored path is queued, so pending jobs do not hold uploads in memory.
+    """
+    record_upload(data)
+    key = content_hash(data)
+    stored = upload_store.put(key, data)
+    return job_queue.submit({
+        "stored": stored,
+        "key": key,
+        "mode": mode,
+        "crop": crop,
+        "location": location,
+        "image_url": url_for('static', filename=f'uploads/{stored}')
+    })
+
+# Partially received resumable uploads, shared by all workers through the filesystem
+resumable_uploads = ResumableUploads(
+    os.environ.get('RESUMABLE_UPLOAD_PATH', os.path.join(app.instance_path, 'resumable')),
+    app.config['MAX_UPLOAD_BYTES'],
+    ttl=float(os.environ.get('RESUMABLE_UPLOAD_TTL', 24 * 3600))
+)
+TUS_HEADERS = {"Tus-Resumable": TUS_VERSION, "Cache-Control": "no-store"}
 
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
-        image = request.files['image']
-        location = request.form.get('location')
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], image.filename)
-        image.save(image_path)
-        # Placeholder result since the AI model is removed
-        disease_info = {
-            "name": "AI Analysis (Maintenance)",
-            "description": "The AI detection engine is currently offline to save resources. Use the chatbot below for help!",
-            "treatment": ["Ensure proper watering", "Check soil pH", "Monitor for pests"],
-            "severity": "N/A"
-        }
-        return render_template(
-            'result.html',
-            result=disease_info,
-            location=location,
-            image_url=url_for('static', filename=f'uploads/{image.filename}')
-        )
+        with stage_seconds.time('receive'):
+            image = request.files['image']
+            location = request.form.get('location')
+            mode = request.form.get('mode') or DEFAULT_PREDICT_MODE
+            crop = hierarchy.resolve_crop(request.form.get('crop'))
+            data = read_upload(image.stream, app.config['MAX_UPLOAD_BYTES'])
+        if mode not in PREDICT_MODES:
+            return f"Error: Unknown prediction mode {mode!r}", 400
+        if request.form.get('crop') and crop is None:
+            return f"Error: Unknown crop {request.form['crop']!r}", 400
+        record_upload(data)
+        key = content_hash(data)
+        with stage_seconds.time('store'):
+            stored = upload_store.put(key, data)
+            derivatives.schedule(stored)
+            image_url = url_for('static', filename=f'uploads/{stored}')
+            sources = image_sources(stored)
+
+        language = request_language()
+        if model is None:
+            return html_response(render_template(
+                'result.html',
+                result=catalogs[language].localize(maintenance_info),
+                location=location,
+                image_url=image_url,
+                image_sources=sources,
+                **page_context(language)
+            ))
+
+        probabilities = classify(data, key, mode, crop, location)
+        record_diagnosis(key, location, probabilities)
+        index = int(np.argmax(probabilities))
+        condition = knowledge_base[index]
+        with stage_seconds.time('render'):
+            return html_response(render_template(
+                'result.html',
+                result=localized_treatments[language][index],
+                healthy=condition.healthy,
+                confidence=float(probabilities[index]),
+                location=location,
+                image_url=image_url,
+                image_sources=sources,
+                **page_context(language)
+            ))
+    except (UploadTooLarge, RequestEntityTooLarge) as e:
+        return f"Error: {str(e)}", 413
+    except UploadError as e:
+        return f"Error: {str(e)}", 400
     except Exception as e:
         return f"Error: {str(e)}", 500
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    """Handle chatbot interactions."""
+    """Handle chatbot interactions; replies are in the catalog language given as "lang"."""
     user_input = request.json.get("message", "").lower()
+    _ = catalogs.get(request.json.get("lang"), catalogs['en']).gettext
 
     if not user_input:
-        return jsonify({"reply": "Please ask a question!"})
+        return jsonify({"reply": _(CHAT_REPLIES["empty"])})
+
+    try:
+        top_k = min(int(request.json.get("top_k", 1)), 10)
+    except (TypeError, ValueError):
+        return jsonify({"error": "top_k must be an integer"}), 400
+    matches = faq_index.search(user_input, k=max(top_k, 1))
+    chat_queries.inc('answered' if matches else 'missed')
+    if not matches:
+        return jsonify({"reply": _(CHAT_REPLIES["unknown"])})
+
+    response = {"reply": _(matches[0][0]["answer"])}
+    if top_k > 1:
+        response["matches"] = [
+            {"question": _(entry["question"]), "answer": _(entry["answer"]), "score": round(score, 3)}
+            for entry, score in matches
+        ]
+    return jsonify(response)
+
+@app.route('/api/v1/jobs', methods=['POST'])
+def create_job():
+    """Accept an image for background diagnosis and return a job id immediately."""
+    if model is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    try:
+        image = request.files['image']
+        mode = request.form.get('mode') or DEFAULT_PREDICT_MODE
+        if mode not in PREDICT_MODES:
+            return jsonify({"error": f"Unknown prediction mode {mode!r}", "modes": PREDICT_MODES}), 400
+        crop = hierarchy.resolve_crop(request.form.get('crop'))
+        if request.form.get('crop') and crop is None:
+            return jsonify({"error": f"Unknown crop {request.form['crop']!r}", "crops": hierarchy.crops}), 400
+        data = read_upload(image.stream, app.config['MAX_UPLOAD_BYTES'])
+        job_id = submit_job(data, mode, crop, request.form.get('location'))
+    except KeyError:
+        return jsonify({"error": "No image uploaded"}), 400
+    except (UploadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({"error": str(e)}), 413
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    url = url_for('get_job', job_id=job_id)
+    return jsonify({"id": job_id, "status": "queued", "url": url}), 202, {"Location": url}
+
+@app.route('/api/v1/jobs/<job_id>')
+def get_job(job_id):
+    """Return a job's status and result; ``?wait=N`` long-polls for up to N seconds."""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    if not math.isfinite(wait):
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    wait = min(wait, 30.0)
+    job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+def upload_options(metadata):
+    """(mode, crop, location) from resumable-upload metadata; raises UploadError if invalid."""
+    mode = metadata.get('mode') or DEFAULT_PREDICT_MODE
+    if mode not in PREDICT_MODES:
+        raise UploadError(f"Unknown prediction mode {mode!r}")
+    crop = hierarchy.resolve_crop(metadata.get('crop'))
+    if metadata.get('crop') and crop is None:
+        raise UploadError(f"Unknown crop {metadata['crop']!r}")
+    return mode, crop, metadata.get('location')
+
+def upload_job_response(job_id, length):
+    url = url_for('get_job', job_id=job_id)
+    headers = {**TUS_HEADERS, "Upload-Offset": str(length), "Location": url}
+    return jsonify({"id": job_id, "status": "queued", "url": url}), 200, headers
+
+@app.route('/api/v1/uploads', methods=['OPTIONS', 'POST'])
+def create_upload():
+    """Start a resumable (tus) upload; send ``Upload-Length`` and optional ``Upload-Metadata``.
+
+    Metadata keys: ``location``, ``mode``, ``crop`` and ``sha256`` (hex digest of the whole file).
+    """
+    if request.method == 'OPTIONS':
+        return '', 204, {**TUS_HEADERS, "Tus-Version": TUS_VERSION,
+                         "Tus-Extension": "creation,checksum,termination",
+                         "Tus-Max-Size": str(app.config['MAX_UPLOAD_BYTES']),
+                         "Tus-Checksum-Algorithm": ','.join(CHECKSUM_ALGORITHMS)}
+    if model is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    try:
+        length = int(request.headers.get('Upload-Length', ''))
+    except ValueError:
+        return jsonify({"error": "Upload-Length header is required"}), 400, TUS_HEADERS
+    try:
+        metadata = parse_metadata(request.headers.get('Upload-Metadata'))
+        upload_options(metadata)
+        upload_id = resumable_uploads.create(length, metadata)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413, TUS_HEADERS
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400, TUS_HEADERS
+    headers = {**TUS_HEADERS, "Location": url_for('resumable_upload', upload_id=upload_id), "Upload-Offset": "0"}
+    return '', 201, headers
+
+@app.route('/api/v1/uploads/<upload_id>', methods=['HEAD', 'PATCH', 'DELETE'])
+def resumable_upload(upload_id):
+    """HEAD reports the offset to resume from, PATCH appends a chunk, DELETE abandons the upload.
+
+    The PATCH that completes the upload hands it to the job queue and returns the job, like /api/v1/jobs.
+    """
+    try:
+        offset, length, metadata, job_id = resumable_uploads.status(upload_id)
+        if request.method == 'HEAD':
+            headers = {**TUS_HEADERS, "Upload-Offset": str(offset), "Upload-Length": str(length)}
+            if job_id:
+                headers["Location"] = url_for('get_job', job_id=job_id)
+            return '', 200, headers
+        if request.method == 'DELETE':
+            resumable_uploads.delete(upload_id)
+            return '', 204, TUS_HEADERS
+        if job_id:
+            # The final chunk's response was lost; answer it again.
+            return upload_job_response(job_id, length)
+        if request.mimetype != 'application/offset+octet-stream':
+            return jsonify({"error": "Content-Type must be application/offset+octet-stream"}), 415, TUS_HEADERS
+        try:
+            client_offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({"error": "Upload-Offset header is required"}), 400, TUS_HEADERS
+        # The job is queued while the upload is still locked, so a retried final PATCH cannot queue another.
+        offset, job_id = resumable_uploads.append(
+            upload_id, client_offset, request.stream, request.headers.get('Upload-Checksum'),
+            finish=lambda data, metadata: submit_job(data, *upload_options(metadata))
+        )
+        if job_id is None:
+            return '', 204, {**TUS_HEADERS, "Upload-Offset": str(offset)}
+        return upload_job_response(job_id, length)
+    except UploadNotFound as e:
+        return jsonify({"error": str(e)}), 404, TUS_HEADERS
+    except OffsetMismatch as e:
+        return jsonify({"error": str(e)}), 409, TUS_HEADERS
+    except UploadBusy as e:
+        return jsonify({"error": str(e)}), 423, TUS_HEADERS
+    except ChecksumMismatch as e:
+        # 460 is tus' "Checksum Mismatch".
+        return jsonify({"error": str(e)}), 460, TUS_HEADERS
+    except (UploadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({"error": str(e)}), 413, TUS_HEADERS
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400, TUS_HEADERS
+    except QueueFull as e:
+        # The bytes are kept; re-sending the final PATCH (with an empty body) retries the hand-off.
+        return jsonify({"error": str(e)}), 503, {**TUS_HEADERS, "Retry-After": "5"}
+
+@app.route('/api/v1/batch', methods=['POST'])
+def batch_predict():
+    """Diagnose a field survey (multipart ``images`` and/or a zip ``archive``), streaming NDJSON."""
+    if model is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    files = [f for f in request.files.getlist('images') if f.filename]
+    archive = request.files.get('archive')
+    if not files and archive is None:
+        return jsonify({"error": "No images uploaded"}), 400
+    default_location = request.form.get('location') or 'unknown'
+
+    def generate():
+        summary = SurveySummary()
+        entries = iter_survey(
+            files,
+            archive.stream if archive is not None else None,
+            default_location,
+            app.config['MAX_UPLOAD_BYTES'],
+            app.config['MAX_SURVEY_FILES']
+        )
+        try:
+            for chunk in chunked(entries, app.config['SURVEY_CHUNK_SIZE']):
+                valid = [e for e in chunk if e.error is None]
+                keys = {}
+                for e in valid:
+                    record_upload(e.data)
+                    keys[id(e)] = content_hash(e.data)
+                results = dict(zip(
+                    map(id, valid),
+                    classify_many([(e.data, keys[id(e)]) for e in valid])
+                ))
+                for entry in chunk:
+                    line = {"name": entry.name, "location": entry.location}
+                    result = results.get(id(entry), UploadError(entry.error))
+                    if isinstance(result, Exception):
+                        line["error"] = str(result)
+                        if entry.name is not None:
+                            summary.add_failure()
+                    else:
+                        index = int(np.argmax(result))
+                        condition = knowledge_base[index]
+                        line.update(label=condition.label, confidence=float(result[index]),
+                                    healthy=condition.healthy)
+                        summary.add(entry.location, condition.label)
+                        outbreak_store.record(keys[id(entry)], entry.location, index, result[index])
+                    yield json.dumps(line) + "\n"
+        except UploadError as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        yield json.dumps({"summary": summary.as_dict()}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/v1/predict', methods=['POST'])
+def api_predict():
+    """Diagnose one image and return the top-k classes and treatment as compact JSON."""
+    if model is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    try:
+        k = min(max(int(request.form.get('top_k', 3)), 1), len(class_names))
+    except ValueError:
+        return jsonify({"error": "top_k must be an integer"}), 400
+    try:
+        location = request.form.get('location')
+        mode = request.form.get('mode') or DEFAULT_PREDICT_MODE
+        if mode not in PREDICT_MODES:
+            return jsonify({"error": f"Unknown prediction mode {mode!r}", "modes": PREDICT_MODES}), 400
+        crop = hierarchy.resolve_crop(request.form.get('crop'))
+        if request.form.get('crop') and crop is None:
+            return jsonify({"error": f"Unknown crop {request.form['crop']!r}", "crops": hierarchy.crops}), 400
+        with stage_seconds.time('receive'):
+            data = read_upload(request.files['image'].stream, app.config['MAX_UPLOAD_BYTES'])
+        record_upload(data)
+        key = content_hash(data)
+        # The same image, models and k always give the same body, so clients can revalidate cheaply.
+        # The prediction-cache key carries the mode and the versions of any extra models it uses.
+        etag = f'{prediction_key(key, mode, crop)}-{model.version}-{k}' + (f'-{crop}' if crop else '') \
+            + (f'-{content_hash(location.encode())[:8]}' if location else '')
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        with stage_seconds.time('store'):
+            upload_store.put(key, data)
+        probabilities = classify(data, key, mode, crop, location)
+        record_diagnosis(key, location, probabilities)
+        with stage_seconds.time('render'):
+            body = prediction_body(probabilities, k, location)
+        return dynamic_response(request, body, 'application/json', etag=etag, cache_control='private, no-cache')
+    except KeyError:
+        return jsonify({"error": "No image uploaded"}), 400
+    except (UploadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({"error": str(e)}), 413
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/v1/treatments/<path:label>')
+def get_treatment(label):
+    """Treatment details for a class label, precompressed and cacheable."""
+    condition = knowledge_base.lookup(label)
+    if condition is None:
+        return jsonify({"error": "Unknown label"}), 404
+    return treatment_bodies[condition.index].response(request, TREATMENT_CACHE_CONTROL)
+
+@app.route('/api/v1/knowledge')
+def knowledge_manifest():
+    """Current knowledge bundle version for ?lang= and where to fetch it; revalidated on every load."""
+    version = knowledge_bundles.get(request.args.get('lang'), knowledge_bundles['en'])["version"]
+    if etag_matches(request, version):
+        return not_modified(version, 'no-cache')
+    body = json.dumps({"version": version, "url": url_for('knowledge_file', version=version)}).encode('utf-8')
+    return dynamic_response(request, body, 'application/json', etag=version, cache_control='no-cache')
+
+@app.route('/api/v1/knowledge/<version>')
+def knowledge_file(version):
+    """The full bundle; its URL changes with its content, so it is cached forever."""
+    body = knowledge_bodies.get(version)
+    if body is None:
+        return jsonify({"error": "Unknown bundle version"}), 404
+    return body.response(request, STATIC_IMMUTABLE)
+
+@app.route('/api/v1/knowledge/delta/<since>/<version>')
+def knowledge_delta(since, version):
+    """Changes from an older bundle to a current one; 404 means fetch the full bundle."""
+    if version not in knowledge_bodies:
+        return jsonify({"error": "Unknown bundle version"}), 404
+    body = knowledge_deltas.get((since, version))
+    if body is None:
+        old = bundle_store.load(since)
+        new = bundles_by_version[version]
+        if old is None or old.get("language", 'en') != new["language"]:
+            return jsonify({"error": "No delta from this version",
+                            "url": url_for('knowledge_file', version=version)}), 404
+        body = CachedBody(encode(delta(old, new)), 'application/json')
+        knowledge_deltas[(since, version)] = body
+    return body.response(request, STATIC_IMMUTABLE)
+
+@app.route('/api/v1/field-map', methods=['POST'])
+def field_map():
+    """Classify the leafy tiles of a wide field or drone photo and return a per-tile disease map."""
+    if model is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    try:
+        with stage_seconds.time('receive'):
+            data = read_upload(request.files['image'].stream, app.config['MAX_UPLOAD_BYTES'])
+        record_upload(data)
+        with stage_seconds.time('decode'):
+            rgb, scale = decode_field(data, app.config['FIELD_MAX_SIDE'], app.config['MAX_IMAGE_PIXELS'])
+            grid = TileGrid(rgb, model.input_size, app.config['FIELD_MIN_COVERAGE'],
+                            app.config['FIELD_MAX_TILES'], scale)
+    except KeyError:
+        return jsonify({"error": "No image uploaded"}), 400
+    except (UploadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({"error": str(e)}), 413
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rows = []
+    with stage_seconds.time('inference'):
+        for batch in grid.batches(app.config['SURVEY_CHUNK_SIZE']):
+            rows.append(run_model(batch))
+    probabilities = np.concatenate(rows) if rows else np.zeros((0, len(class_names)), dtype=np.float32)
+
+    tiles = []
+    counts = {}
+    for (row, col), probs in zip(grid.positions, probabilities):
+        condition = knowledge_base[int(np.argmax(probs))]
+        counts[condition.label] = counts.get(condition.label, 0) + 1
+        tiles.append({
+            "row": int(row), "col": int(col), "box": grid.box(row, col),
+            "coverage": round(float(grid.coverage[row, col]), 3),
+            "region": int(grid.regions[row, col]),
+            "label": condition.label, "healthy": condition.healthy,
+            "confidence": float(probs[condition.index]),
+        })
+    regions = []
+    tile_regions = np.array([grid.regions[p] for p in grid.positions], dtype=np.int32)
+    for region in range(1, grid.region_count + 1):
+        members = tile_regions == region
+        condition = knowledge_base[int(np.argmax(probabilities[members].mean(axis=0)))]
+        regions.append({"id": region, "tiles": int(members.sum()), "label": condition.label,
+                        "healthy": condition.healthy})
+    return jsonify({
+        "grid": {"rows": grid.shape[0], "cols": grid.shape[1], "tile_size": list(model.input_size)},
+        "leaf_fraction": round(grid.leaf_fraction, 3),
+        "tiles_classified": len(grid),
+        "tiles": tiles,
+        "regions": regions,
+        "summary": counts,
+    })
+
+@app.route('/api/v1/outbreaks')
+def outbreaks():
+    """Diagnosis counts per location and disease in hourly, daily or weekly buckets.
+
+    Query: ``granularity`` (hour/day/week), ``days`` back from now (default 30),
+    optional ``location`` and ``label`` (repeatable), ``diseased=1`` to drop healthy classes.
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    try:
+        days = float(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({"error": "days must be a number"}), 400
+    if not math.isfinite(days) or days <= 0:
+        return jsonify({"error": "days must be a positive number"}), 400
+    since = time.time() - days * 86400
+
+    class_indices = None
+    labels = request.args.getlist('label')
+    if labels:
+        conditions = [knowledge_base.lookup(label) for label in labels]
+        if None in conditions:
+            return jsonify({"error": "Unknown label"}), 400
+        class_indices = [c.index for c in conditions]
+    if request.args.get('diseased') == '1':
+        class_indices = [c.index for c in knowledge_base
+                         if not c.healthy and (class_indices is None or c.index in class_indices)]
+
+    series, totals = [], {}
+    for bucket, location, index, count, confidence in outbreak_store.counts(
+            granularity, since, location=request.args.get('location'), class_indices=class_indices):
+        condition = knowledge_base[index]
+        series.append({
+            "bucket": datetime.fromtimestamp(bucket, timezone.utc).isoformat(),
+            "location": location, "label": condition.label, "healthy": condition.healthy,
+            "count": count, "mean_confidence": round(confidence, 4),
+        })
+        per_location = totals.setdefault(location, {})
+        per_location[condition.label] = per_location.get(condition.label, 0) + count
+    return jsonify({"granularity": granularity, "series": series, "totals": totals})
+
+@app.route('/media/<path:name>')
+def media(name):
+    """Serve an upload derivative, or the original until the derivative has been generated."""
+    path, ready = derivatives.resolve(name)
+    if path is None:
+        return jsonify({"error": "Not found"}), 404
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], path)
+    # The fallback must not be cached for long, or browsers would never pick up the smaller file.
+    response.headers['Cache-Control'] = STATIC_IMMUTABLE if ready else 'public, max-age=60'
+    return response
+
+@app.route('/api/v1/similar', methods=['POST'])
+def similar_cases():
+    """Past diagnosed uploads that look most like this image, with what each was diagnosed as."""
+    if case_index is None:
+        return jsonify({"error": "Similar-case search is not enabled"}), 503
+    try:
+        k = min(max(int(request.form.get('k', 5)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    try:
+        with stage_seconds.time('receive'):
+            data = read_upload(request.files['image'].stream, app.config['MAX_UPLOAD_BYTES'])
+        record_upload(data)
+        key = content_hash(data)
+        embedding = case_index.embedding(key)
+        if embedding is None:
+            with stage_seconds.time('decode'):
+                pixels = decode_image(data, model.input_size, app.config['MAX_IMAGE_PIXELS'])
+            with stage_seconds.time('inference'):
+                embedding = batcher.submit(pixels)[len(class_names):]
+    except KeyError:
+        return jsonify({"error": "No image uploaded"}), 400
+    except (UploadTooLarge, RequestEntityTooLarge) as e:
+        return jsonify({"error": str(e)}), 413
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cases = []
+    for case in case_index.search(embedding, k, exclude=key):
+        condition = knowledge_base[case["class_index"]]
+        cases.append({
+            "similarity": round(case["similarity"], 4),
+            "label": condition.label, "healthy": condition.healthy,
+            "confidence": round(case["confidence"], 4),
+            "location": case["location"],
+            "diagnosed_at": datetime.fromtimestamp(case["ts"], timezone.utc).isoformat(),
+            "image_url": url_for('static', filename=f'uploads/{case["image"]}') if case["image"] else None,
+        })
+    return jsonify({"cases": cases})
+
+@app.route('/batcher/stats')
+def batcher_stats():
+    """Report micro-batch sizes and queue wait times."""
+    if batcher is None:
+        return jsonify({"error": "Model not loaded"}), 503
+    return jsonify(batcher.stats())
+
+@app.route('/healthz')
+def healthz():
+    """Readiness probe: 200 once this worker has warmed up, 503 until then."""
+    if warm_pid != os.getpid():
+        return jsonify({"status": "warming"}), 503
+    return jsonify({"status": "ok", "model": model.version if model is not None else None})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of request, stage, cache and queue metrics for all workers."""
+    totals = metrics.totals()
+    hits = cache_lookups.value(totals, 'hit')
+    lookups = hits + cache_lookups.value(totals, 'miss')
+    answered = chat_queries.value(totals, 'answered')
+    queries = answered + chat_queries.value(totals, 'missed')
+    body = metrics.render(totals) + (
+        "# HELP agripal_prediction_cache_hit_ratio Share of prediction cache lookups that hit\n"
+        "# TYPE agripal_prediction_cache_hit_ratio gauge\n"
+        f"agripal_prediction_cache_hit_ratio {hits / lookups if lookups else 0.0}\n"
+        "# HELP agripal_chat_answer_ratio Share of chatbot queries answered from the FAQ\n"
+        "# TYPE agripal_chat_answer_ratio gauge\n"
+        f"agripal_chat_answer_ratio {answered / queries if queries else 0.0}\n"
+    )
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+# Per-endpoint latency; declared last so every route above is known
+ENDPOINTS = sorted(e for e in app.view_functions if e != 'static') + ['static', 'other']
+request_seconds = metrics.histogram(
+    'agripal_request_duration_seconds', "Time spent handling a request, by endpoint",
+    ('endpoint',), [(e,) for e in ENDPOINTS]
+)
+responses_total = metrics.counter(
+    'agripal_responses_total', "Responses by endpoint and status class",
+    ('endpoint', 'status'), [(e, s) for e in ENDPOINTS for s in ('2xx', '3xx', '4xx', '5xx')]
+)
 
-    for item in faq:
-        if item["question"].lower() in user_input:
-            return jsonify({"reply": item["answer"]})
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
-    return jsonify({"reply": "I'm sorry, I don't have information on that. Can you provide more details?"})
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint if request.endpoint in ENDPOINTS else 'other'
+    started = g.get('request_started')
+    if started is not None:
+        request_seconds.observe(endpoint, value=time.perf_counter() - started)
+    status = f'{min(max(response.status_code // 100, 2), 5)}xx'
+    responses_total.inc(endpoint, status)
+    queue_depth.set('jobs', value=job_queue.depth())
+    queue_depth.set('batcher', value=batcher.pending() if batcher is not None else 0)
+    return response
 
 if __name__ == '__main__':
+    warm_up()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
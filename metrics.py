@@ -0,0 +1,275 @@
+"""Low-overhead counters, gauges and histograms shared across gunicorn workers.
+
+All series are declared up front, so every worker computes the same memory
+layout. Values live in a memory-mapped file (under ``/dev/shm`` when
+available): each process owns one row and only ever writes to it, so no
+cross-process locking is needed on the hot path. ``/metrics`` sums the rows
+of all processes and renders them in the Prometheus text format.
+"""
+import bisect
+import fcntl
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_PROCESSES = 64
+
+
+def default_path():
+    """Per-server file: workers share their parent's pid, so they agree on the name."""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f'agripal-metrics-{os.getppid()}.bin')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames, series):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.series = [tuple(str(v) for v in s) for s in (series or [()])]
+        self._index = {s: i for i, s in enumerate(self.series)}
+        self.offset = 0
+
+    @property
+    def width(self):
+        return len(self.series) * self.slots_per_series
+
+    def _base(self, labels):
+        return self.offset + self._index[tuple(str(v) for v in labels)] * self.slots_per_series
+
+
+class Counter(_Metric):
+    kind = 'counter'
+    slots_per_series = 1
+
+    def inc(self, *labels, amount=1.0):
+        self.registry._add(self._base(labels), amount)
+
+    def value(self, totals, *labels):
+        return float(totals[self._base(labels)])
+
+    def render(self, totals):
+        for i, labels in enumerate(self.series):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(totals[self.offset + i])}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *labels, value):
+        self.registry._set(self._base(labels), value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames, series, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One slot per finite bucket, one for +Inf, then sum.
+        self.slots_per_series = len(self.buckets) + 2
+        super().__init__(registry, name, help, labelnames, series)
+
+    def observe(self, *labels, value):
+        base = self._base(labels)
+        self.registry._observe(base + bisect.bisect_left(self.buckets, value), base + len(self.buckets) + 1, value)
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self, totals):
+        n = len(self.buckets)
+        for labels in self.series:
+            base = self._base(labels)
+            counts = np.cumsum(totals[base:base + n + 1])
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                le = bound if bound == '+Inf' else repr(float(bound))
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", le)])} {int(count)}'
+            tags = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum{tags} {_format_value(totals[base + n + 1])}'
+            yield f'{self.name}_count{tags} {int(counts[-1])}'
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.started)
+
+
+class Registry:
+    def __init__(self, path=None, enabled=True):
+        # Resolved on first use, so a registry created in a preloading master names
+        # the file after the master itself, as its workers will.
+        self.path = path
+        self.enabled = enabled
+        self.metrics = []
+        self.width = 1  # slot 0 of each row holds the owning pid
+        self._lock = threading.Lock()
+        self._pid = None
+        self._table = None
+        self._row = None
+
+    def _register(self, metric):
+        if self._table is not None:
+            raise RuntimeError("Metrics must be declared before the first update")
+        metric.offset = self.width
+        self.width += metric.width
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), series=None):
+        return self._register(Counter(self, name, help, labelnames, series))
+
+    def gauge(self, name, help, labelnames=(), series=None):
+        return self._register(Gauge(self, name, help, labelnames, series))
+
+    def histogram(self, name, help, labelnames=(), series=None, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labelnames, series, buckets))
+
+    def _signature(self):
+        layout = ';'.join(f'{m.name}:{m.width}' for m in self.metrics)
+        return float(zlib.crc32(layout.encode()))
+
+    def _attach(self):
+        """Map the shared table (creating or resetting it if the layout changed) and claim a row."""
+        if self.path is None:
+            self.path = default_path()
+        size = (1 + MAX_PROCESSES * self.width) * 8
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            existing = os.fstat(fd).st_size
+            signature = self._signature()
+            fresh = existing != size
+            if not fresh:
+                header = np.memmap(self.path, dtype=np.float64, mode='r', shape=(1,))
+                fresh = header[0] != signature
+                del header
+            if fresh:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            table = np.memmap(self.path, dtype=np.float64, mode='r+', shape=(size // 8,))
+            table[0] = signature
+            rows = table[1:].reshape(MAX_PROCESSES, self.width)
+            self._row = self._claim(rows)
+            self._table = rows
+            self._pid = os.getpid()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _claim(self, rows):
+        pid = os.getpid()
+        owners = rows[:, 0].astype(np.int64)
+        mine = np.flatnonzero(owners == pid)
+        if len(mine):
+            return rows[mine[0]]
+        for i, owner in enumerate(owners):
+            if owner == 0 or not _alive(owner):
+                # Counters of a dead process are kept (so totals stay monotonic), gauges are cleared.
+                self._clear_gauges(rows[i])
+                rows[i, 0] = pid
+                return rows[i]
+        raise RuntimeError(f"More than {MAX_PROCESSES} processes share {self.path}")
+
+    def _clear_gauges(self, row):
+        for metric in self.metrics:
+            if metric.kind == 'gauge':
+                row[metric.offset:metric.offset + metric.width] = 0
+
+    def _ensure_attached(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._attach()
+
+    def _add(self, index, amount):
+        if not self.enabled:
+            return
+        self._ensure_attached()
+        with self._lock:
+            self._row[index] += amount
+
+    def _set(self, index, value):
+        if not self.enabled:
+            return
+        self._ensure_attached()
+        with self._lock:
+            self._row[index] = value
+
+    def _observe(self, bucket, total, value):
+        if not self.enabled:
+            return
+        self._ensure_attached()
+        with self._lock:
+            row = self._row
+            row[bucket] += 1
+            row[total] += value
+
+    def totals(self):
+        """Sum every series across processes; gauges only count live processes."""
+        self._ensure_attached()
+        rows = np.array(self._table)
+        owners = rows[:, 0].astype(np.int64)
+        used = rows[owners != 0]
+        totals = used.sum(axis=0)
+        live = used[[_alive(pid) for pid in owners[owners != 0]]]
+        live_totals = live.sum(axis=0) if len(live) else np.zeros(self.width)
+        for metric in self.metrics:
+            if metric.kind == 'gauge':
+                totals[metric.offset:metric.offset + metric.width] = \
+                    live_totals[metric.offset:metric.offset + metric.width]
+        return totals
+
+    def render(self, totals=None):
+        """Prometheus text exposition of all series."""
+        if not self.enabled:
+            return ''
+        if totals is None:
+            totals = self.totals()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(totals))
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
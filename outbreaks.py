@@ -0,0 +1,140 @@
+"""Append-only log of diagnoses with incrementally maintained outbreak counts.
+
+Every diagnosis becomes one narrow row: the photo's content hash, a location
+id, a timestamp, a class index and a confidence. Rows go into a SQLite
+database in WAL mode that all workers share. A photo is counted once per
+location: a unique index on (photo, location) makes repeats a no-op, however
+they were answered. An insert trigger bumps per-(location, class) counters in
+hourly, daily and weekly buckets. Dashboards read only those counters, so
+they never scan the raw log, however long it grows. Writes are buffered and
+flushed by a background thread in one transaction, so recording adds nothing
+noticeable to a request.
+"""
+import os
+import re
+import time
+
+from process_local import BufferedWriter, LocalConnection, connect
+
+# Bucket widths in seconds; weeks start on Monday (1970-01-05 is a Monday).
+GRANULARITIES = {'hour': 3600, 'day': 86400, 'week': 604800}
+WEEK_OFFSET = 4 * 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS diagnoses (
+    id INTEGER PRIMARY KEY,
+    location_id INTEGER NOT NULL,
+    photo TEXT,
+    ts REAL NOT NULL,
+    class_index INTEGER NOT NULL,
+    confidence REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS diagnoses_photo ON diagnoses (photo, location_id);
+CREATE TABLE IF NOT EXISTS outbreak_counts (
+    granularity TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    location_id INTEGER NOT NULL,
+    class_index INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (granularity, bucket, location_id, class_index)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS diagnoses_aggregate AFTER INSERT ON diagnoses BEGIN
+    INSERT INTO outbreak_counts VALUES
+        ('hour', CAST(NEW.ts / 3600 AS INTEGER) * 3600, NEW.location_id, NEW.class_index, 1, NEW.confidence),
+        ('day', CAST(NEW.ts / 86400 AS INTEGER) * 86400, NEW.location_id, NEW.class_index, 1, NEW.confidence),
+        ('week', (CAST(NEW.ts AS INTEGER) - 345600) / 604800 * 604800 + 345600,
+         NEW.location_id, NEW.class_index, 1, NEW.confidence)
+    ON CONFLICT (granularity, bucket, location_id, class_index) DO UPDATE SET
+        count = count + 1, confidence_sum = confidence_sum + excluded.confidence_sum;
+END;
+"""
+
+
+def location_key(name):
+    """Grouping key for free-text locations: case and spacing are ignored."""
+    return re.sub(r'\s+', ' ', name).strip().casefold()
+
+
+def bucket_start(ts, granularity):
+    width = GRANULARITIES[granularity]
+    offset = WEEK_OFFSET if granularity == 'week' else 0
+    return (int(ts) - offset) // width * width + offset
+
+
+class OutbreakStore:
+    def __init__(self, path, flush_interval=1.0, max_batch=1000):
+        self.path = path
+        self._location_ids = {}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        db = connect(path, 10.0)
+        if db.execute("SELECT 1 FROM sqlite_master WHERE name = 'diagnoses'").fetchone() \
+                and 'photo' not in [row[1] for row in db.execute('PRAGMA table_info(diagnoses)')]:
+            # Logs from before per-photo deduplication keep their rows with no photo.
+            db.execute('ALTER TABLE diagnoses ADD COLUMN photo TEXT')
+        db.close()
+        self._db = LocalConnection(path, 10.0, SCHEMA)
+        self._writer = BufferedWriter(self._write, 'outbreak-writer', flush_interval, max_batch,
+                                      reset=self._location_ids.clear)
+
+    def record(self, photo, location, class_index, confidence, ts=None):
+        """Queue one diagnosis of the photo with content hash ``photo`` for the next flush."""
+        self._writer.put((photo, location or 'unknown', int(class_index), float(confidence), ts or time.time()))
+
+    def _location_id(self, db, name):
+        key = location_key(name) or 'unknown'
+        location_id = self._location_ids.get(key)
+        if location_id is None:
+            db.execute('INSERT OR IGNORE INTO locations (key, name) VALUES (?, ?)', (key, name.strip() or key))
+            location_id = db.execute('SELECT id FROM locations WHERE key = ?', (key,)).fetchone()[0]
+            self._location_ids[key] = location_id
+        return location_id
+
+    def _write(self, rows):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # Ignored rows never reach the trigger, so a repeated photo leaves the counts alone.
+            db.executemany(
+                'INSERT OR IGNORE INTO diagnoses (photo, location_id, ts, class_index, confidence) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(photo, self._location_id(db, location), ts, index, confidence)
+                 for photo, location, index, confidence, ts in rows]
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            # Ids looked up inside the rolled-back transaction may not exist.
+            self._location_ids.clear()
+            raise
+
+    def pending(self):
+        return self._writer.pending()
+
+    def counts(self, granularity='day', since=None, until=None, location=None, class_indices=None):
+        """Return (bucket, location name, class index, count, mean confidence) rows from the aggregates."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        sql = ['SELECT c.bucket, l.name, c.class_index, c.count, c.confidence_sum / c.count',
+               'FROM outbreak_counts c JOIN locations l ON l.id = c.location_id',
+               'WHERE c.granularity = ?']
+        params = [granularity]
+        if since is not None:
+            sql.append('AND c.bucket >= ?')
+            params.append(bucket_start(since, granularity))
+        if until is not None:
+            sql.append('AND c.bucket < ?')
+            params.append(int(until))
+        if location:
+            sql.append('AND l.key = ?')
+            params.append(location_key(location))
+        if class_indices is not None:
+            sql.append(f"AND c.class_index IN ({','.join('?' * len(class_indices))})")
+            params.extend(int(i) for i in class_indices)
+        sql.append('ORDER BY c.bucket, l.name, c.count DESC')
+        return self._db().execute(' '.join(sql), params).fetchall()
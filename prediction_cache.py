@@ -0,0 +1,131 @@
+"""Content-addressed cache of classifier outputs shared by all workers.
+
+Results are keyed by the SHA-256 of the uploaded bytes (and optionally by a
+perceptual hash of the downscaled image) and stored in a local SQLite
+database in WAL mode, so every gunicorn worker on the host sees the same
+entries. Entries expire after ``ttl`` seconds and the least recently used
+ones are evicted once the cache holds more than ``max_entries``.
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from preprocess import DECODE_ERRORS, UploadError, open_image
+from process_local import LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    key TEXT PRIMARY KEY,
+    phash INTEGER,
+    probabilities BLOB NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_phash ON predictions (phash);
+CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed);
+"""
+
+# Hits refresh the LRU timestamp at most this often, to keep reads read-only.
+TOUCH_INTERVAL = 60.0
+# Eviction runs once every this many inserts.
+EVICT_EVERY = 64
+
+
+def content_hash(data):
+    """SHA-256 hex digest of the raw upload bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(data, max_pixels):
+    """64-bit difference hash of the image, robust to re-encoding and resizing.
+
+    Raises UploadError for anything ``decode_image`` would reject, before decoding it.
+    """
+    with open_image(data, max_pixels) as img:
+        try:
+            img.draft('L', (64, 64))
+            pixels = np.asarray(img.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+        except DECODE_ERRORS as e:
+            raise UploadError("The uploaded image is corrupt or truncated") from e
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    value = int(np.packbits(bits).view('>u8')[0])
+    # SQLite integers are signed 64-bit.
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class PredictionCache:
+    def __init__(self, path, namespace='', max_entries=50000, ttl=30 * 24 * 3600):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = LocalConnection(path, 5.0, SCHEMA)
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}' if self.namespace else key
+
+    def _lookup(self, where, params):
+        row = self._db().execute(
+            f'SELECT key, probabilities, created, accessed FROM predictions WHERE {where} LIMIT 1',
+            params
+        ).fetchone()
+        if row is None:
+            return None
+        key, blob, created, accessed = row
+        now = time.time()
+        if now - created > self.ttl:
+            self._db().execute('DELETE FROM predictions WHERE key = ?', (key,))
+            return None
+        if now - accessed > TOUCH_INTERVAL:
+            self._db().execute('UPDATE predictions SET accessed = ? WHERE key = ?', (now, key))
+        return np.frombuffer(blob, dtype=np.float32)
+
+    def get(self, key, phash=None):
+        """Return cached probabilities for ``key`` (or a matching ``phash``), else None."""
+        result = self._lookup('key = ?', (self._key(key),))
+        if result is None and phash is not None:
+            # Only match entries written under the same namespace (model version).
+            prefix = self._key('')
+            result = self._lookup('phash = ? AND substr(key, 1, ?) = ?', (phash, len(prefix), prefix))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, key, probabilities, phash=None):
+        now = time.time()
+        blob = np.asarray(probabilities, dtype=np.float32).tobytes()
+        self._db().execute(
+            'INSERT OR REPLACE INTO predictions (key, phash, probabilities, created, accessed) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (self._key(key), phash, blob, now, now)
+        )
+        self._inserts += 1
+        if self._inserts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries and trim to ``max_entries`` by last access."""
+        db = self._db()
+        db.execute('DELETE FROM predictions WHERE created < ?', (time.time() - self.ttl,))
+        db.execute(
+            'DELETE FROM predictions WHERE key IN '
+            '(SELECT key FROM predictions ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
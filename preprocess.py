@@ -0,0 +1,72 @@
+"""Bounded-memory decoding of uploaded leaf photos.
+
+Uploads are read in chunks with a hard byte limit, the pixel count is checked
+from the image header before anything is decoded, and JPEGs are decoded with
+PIL's draft mode at the smallest DCT scale that still covers the model input.
+A 48 MP phone photo therefore never materialises at full resolution.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+CHUNK_SIZE = 64 * 1024
+
+# What PIL raises for truncated, corrupt or oversized image data once it starts decoding
+DECODE_ERRORS = (OSError, SyntaxError, Image.DecompressionBombError)
+
+
+class UploadError(ValueError):
+    """The upload cannot be processed."""
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class ImageTooLarge(UploadError):
+    pass
+
+
+def read_upload(stream, max_bytes, chunk_size=CHUNK_SIZE):
+    """Read ``stream`` into memory, failing as soon as it exceeds ``max_bytes``."""
+    buffer = io.BytesIO()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if buffer.tell() + len(chunk) > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+        buffer.write(chunk)
+    return buffer.getvalue()
+
+
+def open_image(data, max_pixels):
+    """Open ``data`` lazily and reject it if its header reports too many pixels."""
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Exception as e:
+        raise UploadError("The uploaded file is not a supported image") from e
+    if img.width * img.height > max_pixels:
+        raise ImageTooLarge(f"Image is {img.width}x{img.height}, above the {max_pixels} pixel limit")
+    return img
+
+
+def load_rgb(img, size):
+    """Decode ``img`` to RGB at roughly ``size`` (width, height) or larger."""
+    try:
+        # For JPEG this selects a 1/2, 1/4 or 1/8 scale decode; other formats ignore it.
+        img.draft('RGB', size)
+        img = ImageOps.exif_transpose(img)
+        return img.convert('RGB')
+    except DECODE_ERRORS as e:
+        raise UploadError("The uploaded image is corrupt or truncated") from e
+
+
+def decode_image(data, size, max_pixels):
+    """Decode upload bytes into a contiguous float32 (H, W, 3) array of ``size``."""
+    with open_image(data, max_pixels) as img:
+        rgb = load_rgb(img, size)
+        if rgb.size != size:
+            rgb = rgb.resize(size, Image.BILINEAR, reducing_gap=2.0)
+        return np.ascontiguousarray(rgb, dtype=np.float32)
@@ -0,0 +1,115 @@
+"""Per-process SQLite connections and background threads.
+
+gunicorn forks its workers from a master that has already imported the app.
+Neither a SQLite connection nor a thread survives that fork in a usable
+state, so both are created lazily, on first use in each process, and
+recreated whenever the process id changes.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+def connect(path, timeout=5.0):
+    """Open ``path`` in autocommit mode with WAL journaling, so readers and the writer do not block each other."""
+    db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+
+class LocalConnection:
+    """Call to get this thread's connection to ``path``, opened on first use in each process."""
+
+    def __init__(self, path, timeout=5.0, schema=None):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        if schema is not None:
+            db = connect(path, timeout)
+            db.executescript(schema)
+            db.close()
+
+    def __call__(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = connect(self.path, self.timeout)
+            local.pid = os.getpid()
+        return local.db
+
+
+class ProcessThreads:
+    """Run ``target`` on ``count`` daemon threads, started once in each process that calls ``ensure_started``.
+
+    ``reset`` runs first in every new process, to replace queues and other
+    state inherited from the parent.
+    """
+
+    def __init__(self, target, name, count=1, reset=None):
+        self.target = target
+        self.name = name
+        self.count = count
+        self.reset = reset
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                if self.reset is not None:
+                    self.reset()
+                for i in range(self.count):
+                    name = f'{self.name}-{i}' if self.count > 1 else self.name
+                    threading.Thread(target=self.target, name=name, daemon=True).start()
+                self._pid = os.getpid()
+
+
+class BufferedWriter:
+    """Pass queued items to ``write(items)`` in batches, from one background thread per process.
+
+    A batch is written once ``max_batch`` items are waiting or ``flush_interval``
+    seconds after its first item. The data is best effort: a batch whose write
+    raises one of ``errors`` is dropped and the writer carries on.
+    """
+
+    def __init__(self, write, name, flush_interval=1.0, max_batch=1000, errors=(sqlite3.Error,), reset=None):
+        self.write = write
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.errors = errors
+        self._reset = reset
+        self._queue = queue.Queue()
+        self._threads = ProcessThreads(self._run, name, reset=self._new_process)
+
+    def _new_process(self):
+        self._queue = queue.Queue()
+        if self._reset is not None:
+            self._reset()
+
+    def put(self, item):
+        self._threads.ensure_started()
+        self._queue.put(item)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.write(items)
+            except self.errors:
+                continue
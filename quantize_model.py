@@ -0,0 +1,87 @@
+"""Turn a converted ``.npz`` model into a memory-mapped file with int8 weights.
+
+    python quantize_model.py plant_diseases_model.npz plant_diseases_model.i8
+
+Convolution and dense kernels are quantized symmetrically to int8 with one
+float32 scale per output channel. Biases and batch-norm parameters stay
+float32. Pass ``--float32`` to keep every weight as float32 and only change
+the layout. Check the result with ``evaluate_model.py`` before deploying it.
+"""
+import argparse
+import json
+import struct
+
+import numpy as np
+
+from inference import ALIGNMENT, MAPPED_MAGIC
+
+QUANTIZED_WEIGHTS = ('kernel',)
+
+
+def quantize(kernel):
+    """Return (int8 values, float32 per-column scale) approximating a (K, cout) kernel."""
+    peak = np.abs(kernel).max(axis=0)
+    scale = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    values = np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8)
+    return values, scale
+
+
+def quantize_arrays(arrays):
+    out = {}
+    for name, array in arrays.items():
+        if name.rsplit('.', 1)[-1] in QUANTIZED_WEIGHTS and array.ndim == 2:
+            out[name], out[f'{name}_scale'] = quantize(array)
+        else:
+            out[name] = np.asarray(array, dtype=np.float32)
+    return out
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_mapped(path, meta, arrays):
+    """Write ``arrays`` after a JSON header, each at an aligned offset relative to the file start."""
+    names = sorted(arrays)
+    entries = {name: {'dtype': arrays[name].dtype.str, 'shape': list(arrays[name].shape)} for name in names}
+
+    # Offsets depend on the header length, which depends on the offsets: size it with placeholders first.
+    for name in names:
+        entries[name]['offset'] = 0
+    reserved = len(json.dumps({'meta': meta, 'arrays': entries})) + 32 * len(names) + 64
+    offset = _aligned(len(MAPPED_MAGIC) + 8 + reserved)
+    for name in names:
+        entries[name]['offset'] = offset
+        offset = _aligned(offset + arrays[name].nbytes)
+    header = json.dumps({'meta': meta, 'arrays': entries}).encode()
+    header = header.ljust(reserved)
+
+    with open(path, 'wb') as f:
+        f.write(MAPPED_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name in names:
+            f.seek(entries[name]['offset'])
+            f.write(np.ascontiguousarray(arrays[name]).tobytes())
+        f.truncate(offset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help="Model archive written by convert_model.py (.npz)")
+    parser.add_argument('target', help="Output memory-mapped model file")
+    parser.add_argument('--float32', action='store_true', help="Keep float32 weights, only change the layout")
+    args = parser.parse_args()
+
+    with np.load(args.source, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        arrays = {name: data[name] for name in data.files if name != 'meta'}
+    if not args.float32:
+        arrays = quantize_arrays(arrays)
+    write_mapped(args.target, meta, arrays)
+    size = sum(a.nbytes for a in arrays.values())
+    print(f"Wrote {args.target} ({size / 1e6:.1f} MB of weights)")
+
+
+if __name__ == '__main__':
+    main()
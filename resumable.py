@@ -0,0 +1,264 @@
+"""Resumable chunked uploads, following the tus 1.0 protocol.
+
+A client creates an upload by declaring its length. It then PATCHes chunks
+at the offset the server reports, and after a dropped connection it asks for
+the offset again (HEAD) and carries on from there. Each upload is a
+``<id>.part`` file that chunks are appended to, plus a ``<id>.json`` sidecar
+with the declared length and metadata. All state is on disk, so any gunicorn
+worker can serve any chunk. The request body is streamed to the file in
+``CHUNK_SIZE`` pieces, so memory per upload stays bounded however large the
+chunk is.
+
+A chunk may carry an ``Upload-Checksum`` header (``<algorithm> <base64
+digest>``). A chunk that does not match is discarded. So is a chunk cut off
+mid-way, since it cannot be checked. A chunk without a checksum keeps
+whatever bytes arrived before the connection dropped, which is the point of
+resuming. A ``sha256`` metadata entry (hex) is checked against the whole file
+when the upload completes.
+
+Once complete, the ``.part`` file is removed and the sidecar keeps the id of
+the diagnosis job it was handed to. A client that lost the final response
+can still learn where its result is.
+"""
+import base64
+import binascii
+import fcntl
+import hashlib
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+
+from werkzeug.exceptions import ClientDisconnected
+
+from preprocess import CHUNK_SIZE, UploadError, UploadTooLarge
+
+TUS_VERSION = '1.0.0'
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+UPLOAD_ID = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+
+class UploadNotFound(UploadError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    pass
+
+
+class ChecksumMismatch(UploadError):
+    pass
+
+
+class UploadBusy(UploadError):
+    pass
+
+
+def parse_metadata(header):
+    """Decode a tus ``Upload-Metadata`` header: comma-separated ``key base64value`` pairs."""
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode('utf-8') if value else ''
+        except (binascii.Error, UnicodeDecodeError) as e:
+            raise UploadError(f"Invalid Upload-Metadata value for {key!r}") from e
+    return metadata
+
+
+def parse_checksum(header):
+    """Return (hashlib object, expected digest) for an ``Upload-Checksum`` header, or None."""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(' ')
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise UploadError(f"Unsupported checksum algorithm {algorithm!r}")
+    try:
+        return hashlib.new(algorithm), base64.b64decode(value, validate=True)
+    except binascii.Error as e:
+        raise UploadError("Invalid Upload-Checksum digest") from e
+
+
+class ResumableUploads:
+    def __init__(self, root, max_bytes, ttl=24 * 3600, sweep_interval=600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, upload_id):
+        if not UPLOAD_ID.match(upload_id or ''):
+            raise UploadNotFound("Unknown upload")
+        base = os.path.join(self.root, upload_id)
+        return base + '.part', base + '.json'
+
+    def create(self, length, metadata):
+        """Start an upload of ``length`` bytes; returns its id."""
+        if length < 1:
+            raise UploadError("Upload-Length must be positive")
+        if length > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit")
+        self.sweep()
+        upload_id = secrets.token_urlsafe(16)
+        part, _ = self._paths(upload_id)
+        open(part, 'xb').close()
+        self._write_state(upload_id, {"length": length, "metadata": metadata, "created": time.time()})
+        return upload_id
+
+    def _state(self, upload_id):
+        _, info = self._paths(upload_id)
+        try:
+            with open(info) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFound("Unknown upload") from None
+
+    def _write_state(self, upload_id, state):
+        _, info = self._paths(upload_id)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, info)
+
+    def status(self, upload_id):
+        """Return (offset, length, metadata, job id or None) of an upload."""
+        part, _ = self._paths(upload_id)
+        state = self._state(upload_id)
+        if state.get("job_id"):
+            return state["length"], state["length"], state["metadata"], state["job_id"]
+        try:
+            offset = os.path.getsize(part)
+        except FileNotFoundError:
+            raise UploadNotFound("Unknown upload") from None
+        return offset, state["length"], state["metadata"], None
+
+    def append(self, upload_id, offset, stream, checksum=None, finish=None):
+        """Append ``stream`` at ``offset``; returns (new offset, job id or None).
+
+        ``checksum`` is the value of an ``Upload-Checksum`` header, if any. Once
+        the upload is complete, ``finish(data, metadata)`` hands it off and
+        returns a job id. The id is recorded before the file lock is released,
+        so a retried final chunk gets the same job instead of queueing another.
+        """
+        part, _ = self._paths(upload_id)
+        expected = parse_checksum(checksum)
+        length = self._state(upload_id)["length"]
+        try:
+            f = open(part, 'r+b')
+        except FileNotFoundError:
+            # Completed since the caller last looked.
+            return self._handed_off(upload_id)
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadBusy("Another request is writing to this upload") from None
+            if self._state(upload_id).get("job_id"):
+                return self._handed_off(upload_id)
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise OffsetMismatch(f"Upload-Offset is {offset}, but the upload is at {current}")
+            f.seek(current)
+            written = 0
+            complete = True
+            try:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if current + written + len(chunk) > length:
+                        raise UploadTooLarge(f"Chunk runs past the declared Upload-Length of {length}")
+                    if expected is not None:
+                        expected[0].update(chunk)
+                    f.write(chunk)
+                    written += len(chunk)
+            except ClientDisconnected:
+                # The client went away mid-chunk; what arrived is kept, so it can resume from there.
+                complete = False
+            except Exception:
+                f.truncate(current)
+                raise
+            if expected is not None and (not complete or expected[0].digest() != expected[1]):
+                f.truncate(current)
+                if complete:
+                    raise ChecksumMismatch("Chunk checksum does not match")
+                return current, None
+            f.flush()
+            if current + written < length or finish is None:
+                return current + written, None
+            f.seek(0)
+            data = f.read()
+            metadata = self._state(upload_id)["metadata"]
+            self._verify(upload_id, data, metadata)
+            job_id = finish(data, metadata)
+            self.complete(upload_id, job_id)
+            return length, job_id
+
+    def _handed_off(self, upload_id):
+        state = self._state(upload_id)
+        if not state.get("job_id"):
+            raise UploadNotFound("Unknown upload")
+        return state["length"], state["job_id"]
+
+    def _verify(self, upload_id, data, metadata):
+        if metadata.get('sha256') and hashlib.sha256(data).hexdigest() != metadata['sha256'].lower():
+            self.delete(upload_id)
+            raise ChecksumMismatch("Upload does not match its sha256 metadata")
+
+    def read(self, upload_id):
+        """Return the bytes of a complete upload.
+
+        Raises ChecksumMismatch, and discards the upload, if it does not match its ``sha256`` metadata.
+        """
+        offset, length, metadata, _ = self.status(upload_id)
+        if offset != length:
+            raise OffsetMismatch(f"Upload is at {offset} of {length} bytes")
+        part, _ = self._paths(upload_id)
+        with open(part, 'rb') as f:
+            data = f.read()
+        self._verify(upload_id, data, metadata)
+        return data
+
+    def complete(self, upload_id, job_id):
+        """Record the job a finished upload was handed to and drop its bytes."""
+        state = self._state(upload_id)
+        state["job_id"] = job_id
+        self._write_state(upload_id, state)
+        part, _ = self._paths(upload_id)
+        os.remove(part)
+
+    def delete(self, upload_id):
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def sweep(self):
+        """Remove uploads abandoned for longer than ``ttl``; runs at most every ``sweep_interval``."""
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return 0
+        self._last_sweep = now
+        removed = 0
+        for entry in os.scandir(self.root):
+            upload_id, _, extension = entry.name.partition('.')
+            try:
+                if now - entry.stat().st_mtime <= self.ttl:
+                    continue
+                if extension == 'json':
+                    # An upload still receiving chunks has a fresh .part file.
+                    part = os.path.join(self.root, upload_id + '.part')
+                    if os.path.exists(part) and now - os.path.getmtime(part) <= self.ttl:
+                        continue
+                    self.delete(upload_id)
+                    removed += 1
+                elif extension == 'tmp' or (extension == 'part' and not os.path.exists(entry.path[:-4] + 'json')):
+                    os.remove(entry.path)
+            except (FileNotFoundError, UploadNotFound):
+                continue
+        return removed
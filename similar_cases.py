@@ -0,0 +1,233 @@
+"""Similar-case search over the embeddings of past diagnoses.
+
+Every diagnosed upload contributes its penultimate-layer embedding,
+L2-normalised and stored as float16. Embeddings are appended to one raw
+matrix file (``vectors.f16``). Readers memory-map that file, so all
+workers share it through the page cache. The case metadata lives in SQLite
+in WAL mode, next to the matrix: the upload path, diagnosis, location and
+time of each case, with the row number as the case id.
+
+Search uses an inverted-file (IVF) index. Once ``train_size`` cases exist,
+spherical k-means picks ``lists`` centroids a single time. From then on,
+each new case is filed under its nearest centroid as it is inserted, and a
+query scores only the cases in the ``probes`` nearest lists. The index is
+never rebuilt. Until it is trained, queries scan every case, which is cheap
+at that size. Inserts are buffered and written by a background thread, as
+for the outbreak log.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from process_local import BufferedWriter, LocalConnection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    image TEXT,
+    location TEXT,
+    class_index INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    ts REAL NOT NULL,
+    list INTEGER
+);
+CREATE INDEX IF NOT EXISTS cases_list ON cases (list, id);
+CREATE TABLE IF NOT EXISTS ivf (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    centroids BLOB NOT NULL
+);
+"""
+
+
+def normalize(vectors):
+    """L2-normalise rows (or a single vector) so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def train_centroids(vectors, lists, iterations=10, seed=0):
+    """Spherical k-means: ``lists`` unit-length centroids for normalised ``vectors``."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=min(lists, len(vectors)), replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed lists that lost every member from random vectors.
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class CaseIndex:
+    def __init__(self, path, dim, lists=256, probes=8, train_size=None, flush_interval=1.0, max_batch=256):
+        self.path = path
+        self.dim = dim
+        self.lists = lists
+        self.probes = probes
+        self.train_size = train_size or lists * 16
+        self.vectors_path = os.path.join(path, 'vectors.f16')
+        self.row_bytes = dim * 2
+        self._lock = threading.Lock()
+        self._reset_cache()
+        os.makedirs(path, exist_ok=True)
+        self._db = LocalConnection(os.path.join(path, 'cases.sqlite3'), 10.0, SCHEMA)
+        # The vectors file is written in the same flush, so I/O errors are dropped as well.
+        self._writer = BufferedWriter(self._write, 'case-writer', flush_interval, max_batch,
+                                      errors=(sqlite3.Error, OSError))
+
+    def _reset_cache(self):
+        self._cache_pid = os.getpid()
+        self._last_id = -1
+        self._centroids = None
+        self._members = None
+        self._map = None
+
+    def add(self, key, embedding, class_index, confidence, image=None, location=None, ts=None):
+        """Queue one diagnosed upload for the next flush; uploads already indexed are skipped."""
+        if len(embedding) != self.dim:
+            raise ValueError(f"Expected an embedding of size {self.dim}, got {len(embedding)}")
+        self._writer.put((key, normalize(embedding).astype('<f2'), int(class_index), float(confidence),
+                          image, location, ts or time.time()))
+
+    def pending(self):
+        return self._writer.pending()
+
+    def _write(self, rows):
+        db = self._db()
+        # BEGIN IMMEDIATE serialises writers across workers, so row ids and file offsets agree.
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            keys = list({row[0] for row in rows})
+            existing = {key for (key,) in db.execute(
+                f"SELECT key FROM cases WHERE key IN ({','.join('?' * len(keys))})", keys)}
+            fresh = []
+            for row in rows:
+                if row[0] not in existing:
+                    existing.add(row[0])
+                    fresh.append(row)
+            if fresh:
+                start = db.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM cases').fetchone()[0]
+                vectors = np.stack([row[1] for row in fresh])
+                # The vector is written before its row commits; an aborted batch is overwritten by the next.
+                fd = os.open(self.vectors_path, os.O_WRONLY | os.O_CREAT, 0o644)
+                try:
+                    os.pwrite(fd, vectors.tobytes(), start * self.row_bytes)
+                finally:
+                    os.close(fd)
+                centroids = self._stored_centroids(db)
+                lists = (np.argmax(vectors.astype(np.float32) @ centroids.T, axis=1).tolist()
+                         if centroids is not None else [None] * len(fresh))
+                db.executemany(
+                    'INSERT INTO cases (id, key, image, location, class_index, confidence, ts, list) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(start + i, key, image, location, index, confidence, ts, lst)
+                     for i, ((key, _, index, confidence, image, location, ts), lst) in enumerate(zip(fresh, lists))]
+                )
+                if centroids is None and start + len(fresh) >= self.train_size:
+                    self._train(db, start + len(fresh))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def _stored_centroids(self, db):
+        row = db.execute('SELECT centroids FROM ivf WHERE id = 0').fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).reshape(-1, self.dim) if row else None
+
+    def _train(self, db, count):
+        """Pick the IVF centroids from a sample and file every existing case under one; runs once."""
+        vectors = np.memmap(self.vectors_path, dtype='<f2', mode='r', shape=(count, self.dim))
+        sample = np.random.default_rng(0).choice(count, size=min(count, self.lists * 64), replace=False)
+        centroids = train_centroids(vectors[np.sort(sample)].astype(np.float32), self.lists)
+        db.execute('INSERT INTO ivf (id, centroids) VALUES (0, ?)', (centroids.astype(np.float32).tobytes(),))
+        for start in range(0, count, 65536):
+            chunk = vectors[start:start + 65536].astype(np.float32)
+            lists = np.argmax(chunk @ centroids.T, axis=1)
+            db.executemany('UPDATE cases SET list = ? WHERE id = ?',
+                           [(int(lst), start + i) for i, lst in enumerate(lists)])
+        del vectors
+
+    def _refresh(self):
+        """Pull cases inserted since the last query (by any worker) into the in-memory lists."""
+        if self._cache_pid != os.getpid():
+            self._reset_cache()
+        db = self._db()
+        if self._centroids is None:
+            centroids = self._stored_centroids(db)
+            if centroids is not None:
+                # Trained since the last look: start over with the per-list layout.
+                self._centroids = centroids
+                self._last_id = -1
+                self._members = [np.empty(0, dtype=np.int64) for _ in range(len(centroids))]
+            elif self._members is None:
+                self._members = np.empty(0, dtype=np.int64)
+        new = db.execute('SELECT id, list FROM cases WHERE id > ? ORDER BY id', (self._last_id,)).fetchall()
+        if not new:
+            return
+        ids = np.fromiter((row[0] for row in new), dtype=np.int64, count=len(new))
+        if self._centroids is None:
+            self._members = np.concatenate([self._members, ids])
+        else:
+            lists = np.fromiter((row[1] for row in new), dtype=np.int64, count=len(new))
+            order = np.argsort(lists, kind='stable')
+            bounds = np.flatnonzero(np.diff(lists[order])) + 1
+            for group in np.split(order, bounds):
+                lst = lists[group[0]]
+                self._members[lst] = np.concatenate([self._members[lst], ids[group]])
+        self._last_id = int(ids[-1])
+        rows = os.path.getsize(self.vectors_path) // self.row_bytes
+        if self._map is None or len(self._map) <= self._last_id:
+            self._map = np.memmap(self.vectors_path, dtype='<f2', mode='r', shape=(rows, self.dim))
+
+    def __len__(self):
+        return self._db().execute('SELECT COUNT(*) FROM cases').fetchone()[0]
+
+    def embedding(self, key):
+        """Stored (normalised) embedding of an indexed upload, or None."""
+        row = self._db().execute('SELECT id FROM cases WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._refresh()
+            vectors = self._map
+        return vectors[row[0]].astype(np.float32) if vectors is not None and row[0] < len(vectors) else None
+
+    def search(self, embedding, k=5, exclude=None):
+        """Return the ``k`` cases most similar to ``embedding`` as dicts with a cosine ``similarity``."""
+        query = normalize(embedding)
+        with self._lock:
+            self._refresh()
+            centroids, members, vectors = self._centroids, self._members, self._map
+        if vectors is None:
+            return []
+        if centroids is None:
+            candidates = members
+        else:
+            probe = np.argsort(centroids @ query)[::-1][:self.probes]
+            candidates = np.sort(np.concatenate([members[lst] for lst in probe]))
+        if not len(candidates):
+            return []
+        scores = vectors[candidates].astype(np.float32) @ query
+        # One spare in case the query image itself is among the results.
+        take = min(k + 1, len(scores))
+        top = np.argpartition(-scores, take - 1)[:take]
+        top = top[np.argsort(-scores[top])]
+        similarity = {int(candidates[i]): float(scores[i]) for i in top}
+        rows = self._db().execute(
+            'SELECT id, key, image, location, class_index, confidence, ts FROM cases '
+            f"WHERE id IN ({','.join('?' * len(similarity))})", list(similarity)
+        ).fetchall()
+        cases = [
+            {"similarity": similarity[id_], "key": key, "image": image, "location": location,
+             "class_index": class_index, "confidence": confidence, "ts": ts}
+            for id_, key, image, location, class_index, confidence, ts in rows if key != exclude
+        ]
+        cases.sort(key=lambda case: -case["similarity"])
+        return cases[:k]
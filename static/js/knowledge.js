@@ -0,0 +1,108 @@
+// Local copy of the AgriPal knowledge bundle (treatments and FAQ with its BM25
+// index, see knowledge_bundle.py). Kept in localStorage and brought up to date
+// with a small delta when the server's version changes, so chat answers and
+// treatment lookups work without a round trip, and offline. The bundle is in the
+// page's language (<html lang>), each language kept under its own key. Only the
+// texts are translated: questions are matched against the English FAQ, so a
+// query in another script finds nothing, here and in /chat alike.
+const AgriPalKnowledge = (() => {
+    const LANGUAGE = document.documentElement.lang || 'en';
+    const STORAGE_KEY = `agripal-knowledge-${LANGUAGE}`;
+    let bundle = null;
+    let stopwords = new Set();
+    // Term -> vocabulary position. Kept here rather than on the bundle, which is stored as JSON.
+    let terms = new Map();
+
+    function use(next) {
+        bundle = next;
+        stopwords = new Set(next ? next.faq.stopwords : []);
+        terms = new Map(next ? next.faq.vocabulary.map((term, i) => [term, i]) : []);
+    }
+
+    function stored() {
+        try {
+            return JSON.parse(localStorage.getItem(STORAGE_KEY));
+        } catch (e) {
+            return null;
+        }
+    }
+
+    function store(next) {
+        try {
+            localStorage.setItem(STORAGE_KEY, JSON.stringify(next));
+        } catch (e) {
+            // Storage full or disabled: the copy lasts for this page only.
+        }
+    }
+
+    function applyDelta(base, delta) {
+        if (base.version !== delta.from) return null;
+        const next = Object.assign({}, base, { version: delta.version });
+        for (const section of ['treatments', 'aliases']) {
+            if (!delta[section]) continue;
+            next[section] = Object.assign({}, base[section], delta[section].set);
+            for (const key of delta[section].remove) delete next[section][key];
+        }
+        for (const section of ['healthy', 'faq']) {
+            if (delta[section]) next[section] = delta[section];
+        }
+        return next;
+    }
+
+    async function sync() {
+        use(stored());
+        try {
+            const manifest = await (await fetch(`/api/v1/knowledge?lang=${encodeURIComponent(LANGUAGE)}`)).json();
+            if (bundle && bundle.version === manifest.version) return bundle;
+            let next = null;
+            if (bundle) {
+                const response = await fetch(`/api/v1/knowledge/delta/${bundle.version}/${manifest.version}`);
+                if (response.ok) next = applyDelta(bundle, await response.json());
+            }
+            if (!next) next = await (await fetch(manifest.url)).json();
+            use(next);
+            store(next);
+        } catch (e) {
+            // Offline or server unavailable: keep whatever copy we have.
+        }
+        return bundle;
+    }
+
+    // Must match faq_index.tokenize.
+    function stem(token) {
+        if (token.length > 4 && token.endsWith('ves')) return token.slice(0, -3) + 'f';
+        if (token.length > 4 && token.endsWith('oes')) return token.slice(0, -2);
+        if (token.length > 4 && token.endsWith('ies')) return token.slice(0, -3) + 'y';
+        if (token.length > 3 && token.endsWith('s') && !token.endsWith('ss')) return token.slice(0, -1);
+        return token;
+    }
+
+    function tokenize(text) {
+        return (text.toLowerCase().match(/[a-z0-9]+/g) || []).filter(t => !stopwords.has(t)).map(stem);
+    }
+
+    // Best FAQ entry for a question as {question, answer, score}, or null when nothing scores high enough.
+    function search(query) {
+        if (!bundle) return null;
+        const faq = bundle.faq;
+        const scores = new Float64Array(faq.entries.length);
+        for (const term of new Set(tokenize(query))) {
+            const t = terms.get(term);
+            if (t === undefined) continue;
+            for (let p = faq.indptr[t]; p < faq.indptr[t + 1]; p++) scores[faq.docs[p]] += faq.weights[p];
+        }
+        let best = -1;
+        scores.forEach((score, i) => { if (best < 0 || score > scores[best]) best = i; });
+        if (best < 0 || scores[best] < faq.min_score) return null;
+        return { question: faq.entries[best][0], answer: faq.entries[best][1], score: scores[best] };
+    }
+
+    // Treatment for a class label, tolerating the same spellings as the server.
+    function treatment(label) {
+        if (!bundle) return null;
+        const canonical = bundle.treatments[label] ? label : bundle.aliases[label.toLowerCase().replace(/[^a-z0-9]/g, '')];
+        return canonical ? { label: canonical, healthy: bundle.healthy.includes(canonical), ...bundle.treatments[canonical] } : null;
+    }
+
+    return { ready: sync(), loaded: () => bundle !== null, search, treatment };
+})();
@@ -0,0 +1,104 @@
+"""Helpers for diagnosing a whole field survey in one request.
+
+Photos arrive either as a multipart list or as a zip archive. Zip members are
+read one at a time straight from the uploaded archive, never extracted to
+disk, and a member's top-level folder is used as its location
+(``FieldA/IMG_001.jpg`` -> ``FieldA``).
+"""
+import zipfile
+import zlib
+
+from preprocess import UploadError, read_upload
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+
+# A member can use an unsupported compression method or have a corrupt stream;
+# each fails on its own, as do encrypted members (RuntimeError).
+MEMBER_ERRORS = (UploadError, zipfile.BadZipFile, OSError, NotImplementedError, EOFError, zlib.error)
+
+
+class SurveyEntry:
+    __slots__ = ('name', 'location', 'data', 'error')
+
+    def __init__(self, name, location, data=None, error=None):
+        self.name = name
+        self.location = location
+        self.data = data
+        self.error = error
+
+
+def _zip_entries(archive, default_location, max_bytes):
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile as e:
+        raise UploadError("The uploaded archive is not a valid zip file") from e
+    with zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if '__MACOSX' in name.split('/'):
+                continue
+            folder, _, _ = name.rpartition('/')
+            location = folder.split('/', 1)[0] if folder else default_location
+            if info.file_size > max_bytes:
+                yield SurveyEntry(name, location, error=f"Image exceeds the {max_bytes} byte limit")
+                continue
+            try:
+                # The declared size can lie, so the read is bounded as well.
+                with zf.open(info) as member:
+                    yield SurveyEntry(name, location, data=read_upload(member, max_bytes))
+            except RuntimeError:
+                yield SurveyEntry(name, location, error="Encrypted zip members are not supported")
+            except MEMBER_ERRORS as e:
+                yield SurveyEntry(name, location, error=str(e))
+
+
+def iter_survey(files, archive, default_location, max_bytes, max_files):
+    """Yield up to ``max_files`` SurveyEntry objects from uploaded files and/or a zip archive."""
+    def entries():
+        for f in files:
+            try:
+                yield SurveyEntry(f.filename, default_location, data=read_upload(f.stream, max_bytes))
+            except UploadError as e:
+                yield SurveyEntry(f.filename, default_location, error=str(e))
+        if archive is not None:
+            yield from _zip_entries(archive, default_location, max_bytes)
+
+    for count, entry in enumerate(entries()):
+        if count >= max_files:
+            yield SurveyEntry(None, None, error=f"Survey truncated after {max_files} images")
+            return
+        yield entry
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SurveySummary:
+    """Disease counts per location."""
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.failed = 0
+
+    def add(self, location, label):
+        per_location = self.counts.setdefault(location, {})
+        per_location[label] = per_location.get(label, 0) + 1
+        self.total += 1
+
+    def add_failure(self):
+        self.failed += 1
+
+    def as_dict(self):
+        return {"images": self.total, "failed": self.failed, "locations": self.counts}
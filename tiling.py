@@ -0,0 +1,124 @@
+"""Leaf detection and tiling for wide field and drone photos.
+
+The frame is decoded at a bounded working resolution and cut into a grid of
+model-sized tiles. A vegetation mask (excess-green index, plus an HSV hue
+band so yellowing leaves still count) gives each tile a leaf coverage. Only
+tiles above ``min_coverage`` are classified, so the cost follows the leaf
+area rather than the megapixel count. Neighbouring leaf tiles are grouped
+into connected regions so the map can be summarised per plant or patch.
+"""
+from collections import deque
+
+import numpy as np
+from PIL import Image
+
+from preprocess import load_rgb, open_image
+
+# Excess-green threshold on chromatic coordinates (2g - r - b, with r + g + b = 1).
+EXG_THRESHOLD = 0.05
+# Hue band (degrees) counted as foliage, from yellowing to blue-green leaves.
+HUE_RANGE = (45.0, 170.0)
+MIN_SATURATION = 0.2
+MIN_VALUE = 0.15
+
+
+def vegetation_mask(rgb):
+    """Boolean (H, W) mask of foliage pixels in a uint8 (H, W, 3) image."""
+    pixels = rgb.astype(np.float32)
+    r, g, b = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    total = r + g + b
+    total[total == 0] = 1.0
+    exg = (2 * g - r - b) / total
+
+    high = pixels.max(axis=-1)
+    low = pixels.min(axis=-1)
+    chroma = high - low
+    safe = np.where(chroma == 0, 1.0, chroma)
+    hue = np.where(
+        high == r, ((g - b) / safe) % 6,
+        np.where(high == g, (b - r) / safe + 2, (r - g) / safe + 4)
+    ) * 60.0
+    saturation = chroma / np.where(high == 0, 1.0, high)
+    hsv = ((hue >= HUE_RANGE[0]) & (hue <= HUE_RANGE[1]) & (saturation >= MIN_SATURATION)
+           & (high >= MIN_VALUE * 255) & (chroma > 0))
+    return (exg > EXG_THRESHOLD) | hsv
+
+
+def decode_field(data, max_side, max_pixels):
+    """Decode a field photo with its long side at most ``max_side``; returns (uint8 array, scale)."""
+    with open_image(data, max_pixels) as img:
+        original = max(img.width, img.height)
+        factor = min(1.0, max_side / original)
+        size = (max(1, round(img.width * factor)), max(1, round(img.height * factor)))
+        rgb = load_rgb(img, size)
+        # exif_transpose may have swapped the axes, so size is recomputed from the result.
+        factor = min(1.0, max_side / max(rgb.size))
+        size = (max(1, round(rgb.width * factor)), max(1, round(rgb.height * factor)))
+        if rgb.size != size:
+            rgb = rgb.resize(size, Image.BILINEAR, reducing_gap=2.0)
+        return np.asarray(rgb), original / max(size)
+
+
+def connected_regions(selected):
+    """Label 4-connected groups of True cells in a small boolean grid; 0 means unselected."""
+    labels = np.zeros(selected.shape, dtype=np.int32)
+    rows, cols = selected.shape
+    count = 0
+    for start in zip(*np.nonzero(selected)):
+        if labels[start]:
+            continue
+        count += 1
+        labels[start] = count
+        pending = deque([start])
+        while pending:
+            r, c = pending.popleft()
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < rows and 0 <= nc < cols and selected[nr, nc] and not labels[nr, nc]:
+                    labels[nr, nc] = count
+                    pending.append((nr, nc))
+    return labels, count
+
+
+class TileGrid:
+    """Model-sized tiles of a field photo, with leaf coverage and region labels."""
+
+    def __init__(self, rgb, tile_size, min_coverage=0.3, max_tiles=256, scale=1.0):
+        tile_w, tile_h = tile_size
+        height, width = rgb.shape[:2]
+        self.tile_size = tile_size
+        self.scale = scale
+        self.shape = (-(-height // tile_h), -(-width // tile_w))
+        rows, cols = self.shape
+
+        # Edge tiles are padded with black, which the mask treats as background.
+        padded = np.zeros((rows * tile_h, cols * tile_w, 3), dtype=np.uint8)
+        padded[:height, :width] = rgb
+        self._tiles = padded.reshape(rows, tile_h, cols, tile_w, 3).swapaxes(1, 2)
+        mask = vegetation_mask(padded)
+        self.coverage = mask.reshape(rows, tile_h, cols, tile_w).mean(axis=(1, 3))
+        self.leaf_fraction = float(mask[:height, :width].mean()) if mask.size else 0.0
+
+        selected = self.coverage >= min_coverage
+        if selected.sum() > max_tiles:
+            # Keep the leafiest tiles when a frame is mostly foliage.
+            keep = np.argsort(self.coverage, axis=None, kind='stable')[-max_tiles:]
+            selected = np.zeros_like(selected)
+            selected.flat[keep] = True
+        self.selected = selected
+        self.regions, self.region_count = connected_regions(selected)
+        self.positions = list(zip(*np.nonzero(selected)))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def batches(self, size):
+        """Yield float32 (N, H, W, 3) stacks of the selected tiles, in ``positions`` order."""
+        for start in range(0, len(self.positions), size):
+            chunk = self.positions[start:start + size]
+            rows, cols = (np.array(axis) for axis in zip(*chunk))
+            yield self._tiles[rows, cols].astype(np.float32)
+
+    def box(self, row, col):
+        """(x, y, width, height) of a tile in original image pixels."""
+        tile_w, tile_h = self.tile_size
+        return [round(v * self.scale) for v in (col * tile_w, row * tile_h, tile_w, tile_h)]
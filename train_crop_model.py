@@ -0,0 +1,139 @@
+"""Train the small stage-one crop/health model for hierarchical inference.
+
+    python train_crop_model.py dataset/ crop_model.npz
+
+The folder is laid out as for ``evaluate_model.py``: one sub-folder per
+disease class. Every class is mapped to its ``<crop>_healthy`` or
+``<crop>_diseased`` output (see ``hierarchy.py``). A two-layer perceptron is
+trained on thumbnails, using NumPy only. The thumbnails are made exactly as
+the app makes them: decoded at the full classifier's input size, then
+box-filtered down. The result is a regular ``.npz`` model, so
+``quantize_model.py`` and ``load_model`` work on it unchanged.
+"""
+import argparse
+import os
+
+import numpy as np
+
+from convert_model import save
+from evaluate_model import labelled_images
+from hierarchy import CropHierarchy, downsample
+from inference import load_model
+from preprocess import UploadError, decode_image
+
+
+def load_samples(samples, source_size, size, max_pixels=64_000_000):
+    """Return (thumbnails, class indices) for (path, class index) pairs."""
+    images, targets = [], []
+    for path, label in samples:
+        try:
+            with open(path, 'rb') as f:
+                pixels = decode_image(f.read(), source_size, max_pixels)
+        except (OSError, UploadError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        images.append(downsample(pixels, size))
+        targets.append(label)
+    if not images:
+        raise SystemExit("No labelled images found")
+    return np.stack(images), np.array(targets)
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def train(x, y, classes, hidden=64, epochs=40, batch_size=64, learning_rate=1e-3, seed=0):
+    """Fit flatten -> dense(relu) -> dense(softmax) with Adam; returns (meta layers, arrays)."""
+    rng = np.random.default_rng(seed)
+    x = x / 255.0
+    mean = x.mean(axis=(0, 1, 2))
+    std = x.std(axis=(0, 1, 2)) + 1e-6
+    features = ((x - mean) / std).reshape(len(x), -1).astype(np.float32)
+
+    params = [
+        rng.normal(0, np.sqrt(2.0 / features.shape[1]), (features.shape[1], hidden)).astype(np.float32),
+        np.zeros(hidden, dtype=np.float32),
+        rng.normal(0, np.sqrt(1.0 / hidden), (hidden, classes)).astype(np.float32),
+        np.zeros(classes, dtype=np.float32),
+    ]
+    moments = [np.zeros_like(p) for p in params]
+    velocities = [np.zeros_like(p) for p in params]
+    step = 0
+    for epoch in range(epochs):
+        order = rng.permutation(len(features))
+        loss = 0.0
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            xb, yb = features[batch], y[batch]
+            w1, b1, w2, b2 = params
+            h = np.maximum(xb @ w1 + b1, 0)
+            p = _softmax(h @ w2 + b2)
+            loss += -np.log(p[np.arange(len(yb)), yb] + 1e-9).sum()
+
+            dz = p
+            dz[np.arange(len(yb)), yb] -= 1
+            dz /= len(yb)
+            dh = (dz @ w2.T) * (h > 0)
+            grads = [xb.T @ dh, dh.sum(axis=0), h.T @ dz, dz.sum(axis=0)]
+
+            step += 1
+            for p_, g, m, v in zip(params, grads, moments, velocities):
+                m *= 0.9
+                m += 0.1 * g
+                v *= 0.999
+                v += 0.001 * g * g
+                p_ -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+        print(f"epoch {epoch + 1:3d}  loss {loss / len(features):.4f}")
+
+    layers = [{'type': 'scale_shift'}, {'type': 'flatten'},
+              {'type': 'dense', 'activation': 'relu'}, {'type': 'dense', 'activation': 'softmax'}]
+    arrays = {'0.scale': 1.0 / std, '0.shift': -mean / std,
+              '2.kernel': params[0], '2.bias': params[1], '3.kernel': params[2], '3.bias': params[3]}
+    return layers, {name: np.asarray(a, dtype=np.float32) for name, a in arrays.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('images', help="Folder with one sub-folder of images per disease class")
+    parser.add_argument('output', help="Where to write the stage-one .npz model")
+    parser.add_argument('--reference', default=os.environ.get('MODEL_PATH', 'plant_diseases_model.npz'),
+                        help="Full classifier; uploads are decoded at its input size")
+    parser.add_argument('--size', type=int, default=32, help="Thumbnail side in pixels")
+    parser.add_argument('--hidden', type=int, default=64)
+    parser.add_argument('--epochs', type=int, default=40)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--validation', type=float, default=0.1, help="Fraction of images held out")
+    args = parser.parse_args()
+
+    from main import knowledge_base
+    hierarchy = CropHierarchy(knowledge_base)
+    source_size = load_model(args.reference).input_size
+    size = (args.size, args.size)
+
+    x, classes = load_samples(labelled_images(args.images, [c.label for c in knowledge_base]), source_size, size)
+    y = np.array([hierarchy.stage_labels.index(hierarchy.stage_label(c)) for c in classes])
+    order = np.random.default_rng(1).permutation(len(x))
+    held_out = order[:int(len(x) * args.validation)]
+    kept = order[len(held_out):]
+
+    layers, arrays = train(x[kept], y[kept], len(hierarchy.stage_labels), args.hidden, args.epochs,
+                           learning_rate=args.learning_rate)
+    meta = {'input_shape': [args.size, args.size, 3], 'rescale': 1.0 / 255.0,
+            'labels': hierarchy.stage_labels, 'layers': layers}
+    save(args.output, meta, arrays)
+
+    if len(held_out):
+        model = load_model(args.output)
+        probabilities = model.predict(x[held_out])
+        accuracy = float((probabilities.argmax(axis=1) == y[held_out]).mean())
+        exits = [hierarchy.stage_one(p)[0] is not None for p in probabilities]
+        wrong_exits = sum(e and not hierarchy.stage_outputs[t][1] for e, t in zip(exits, y[held_out]))
+        print(f"validation accuracy {accuracy:.4f}, early exits {np.mean(exits):.2%}, "
+              f"diseased leaves exited as healthy {wrong_exits}")
+
+
+if __name__ == '__main__':
+    main()
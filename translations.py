@@ -0,0 +1,130 @@
+"""Pre-translated text for localized pages, treatments and chat answers.
+
+Each supported language has a catalog, ``translations/<code>.json``, mapping
+English source strings to their translation. The catalogs are produced
+offline by ``compile_translations.py`` using a pluggable machine-translation
+backend. Each one can then be corrected by hand, since the compiler only
+translates strings the catalog does not have yet. At startup every catalog
+is loaded once. Treatments, FAQ answers and whole pages are then localized
+ahead of time, so a localized page costs the same as an English one.
+
+Template strings are marked as ``{{ _('...') }}``; ``_`` is the catalog's
+``gettext``, passed in the template context.
+"""
+import glob
+import importlib
+import json
+import os
+import re
+
+SOURCE_LANGUAGE = 'en'
+
+# Native names for the language picker; codes follow the catalogs on disk.
+LANGUAGE_NAMES = {
+    'en': 'English', 'hi': 'हिन्दी', 'bn': 'বাংলা', 'mr': 'मराठी', 'ta': 'தமிழ்', 'te': 'తెలుగు',
+    'ur': 'اردو', 'sw': 'Kiswahili', 'es': 'Español', 'fr': 'Français', 'pt': 'Português',
+    'id': 'Bahasa Indonesia', 'vi': 'Tiếng Việt', 'ar': 'العربية', 'zh': '中文',
+}
+
+# Treatment fields whose values are used as keys by the templates, not shown as-is.
+UNTRANSLATED_FIELDS = frozenset({'severity'})
+
+MESSAGE_RE = re.compile(r"""\b_\(\s*(?:'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)")\s*\)""")
+
+
+def template_messages(directory):
+    """Strings marked ``_('...')`` in the Jinja templates under ``directory``."""
+    messages = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            for single, double in MESSAGE_RE.findall(f.read()):
+                messages.append(re.sub(r'\\(.)', r'\1', single or double))
+    return messages
+
+
+def data_messages(value):
+    """Every user-visible string in a nested treatment/FAQ structure."""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [m for key, item in value.items() for m in data_messages(item)]
+    if isinstance(value, (list, tuple)):
+        return [m for item in value for m in data_messages(item)]
+    return []
+
+
+class Catalog:
+    def __init__(self, language, messages=None):
+        self.language = language
+        self.name = LANGUAGE_NAMES.get(language, language)
+        self.messages = dict(messages or {})
+
+    def __len__(self):
+        return len(self.messages)
+
+    def gettext(self, text):
+        """Translation of ``text``, or ``text`` itself if the catalog lacks it."""
+        return self.messages.get(text) or text
+
+    def localize(self, value, key=None):
+        """Copy of a nested dict/list structure with its strings translated."""
+        if isinstance(value, str):
+            return value if key in UNTRANSLATED_FIELDS else self.gettext(value)
+        if isinstance(value, dict) or hasattr(value, 'items'):
+            return {k: self.localize(v, k) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.localize(v, key) for v in value]
+        return value
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['language'], data['messages'])
+
+    def save(self, path):
+        data = {"language": self.language, "messages": dict(sorted(self.messages.items()))}
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+            f.write('\n')
+        os.replace(temp_path, path)
+
+
+def load_catalogs(directory):
+    """{code: Catalog} for every catalog in ``directory``, English (the identity) first."""
+    catalogs = {SOURCE_LANGUAGE: Catalog(SOURCE_LANGUAGE)}
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        catalog = Catalog.load(path)
+        if catalog.language != SOURCE_LANGUAGE:
+            catalogs[catalog.language] = catalog
+    return catalogs
+
+
+class ArgosBackend:
+    """Offline machine translation with Argos Translate (``pip install argostranslate``).
+
+    The language packages must be installed beforehand, e.g. with
+    ``argospm install translate-en_hi``.
+    """
+
+    def __init__(self):
+        from argostranslate import translate
+
+        self._translate = translate.translate
+
+    def translate(self, texts, source, target):
+        return [self._translate(text, source, target) for text in texts]
+
+
+BACKENDS = {'argos': ArgosBackend}
+
+
+def load_backend(spec):
+    """A backend by name, or any ``module:factory`` returning an object with ``translate(texts, source, target)``."""
+    if spec in BACKENDS:
+        return BACKENDS[spec]()
+    module, _, factory = spec.partition(':')
+    if not factory:
+        raise ValueError(f"Unknown translation backend {spec!r}; use one of {sorted(BACKENDS)} or module:factory")
+    return getattr(importlib.import_module(module), factory)()
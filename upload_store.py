@@ -0,0 +1,162 @@
+"""Content-addressed, sharded storage for uploaded images.
+
+Each unique upload is written once to ``<root>/ab/cd/<sha256>.<ext>``, where
+``ab`` and ``cd`` are the first two byte pairs of the hash. Writes go to a
+temporary file in the shard directory followed by an atomic rename, so
+concurrent workers never observe a partial file. A background retention job
+deletes files past ``max_age`` and then the oldest files until the store
+fits in ``max_bytes``.
+"""
+import os
+import tempfile
+import time
+
+from process_local import ProcessThreads
+
+# Leftover temporary files older than this are assumed abandoned.
+STALE_TEMP_AGE = 3600.0
+
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+]
+
+
+def guess_extension(data):
+    """File extension for ``data`` based on its magic bytes."""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return 'img'
+
+
+class UploadStore:
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, max_age=30 * 24 * 3600, retention_interval=3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention_interval = retention_interval
+        self._retention = ProcessThreads(self._retention_loop, 'upload-retention')
+        os.makedirs(root, exist_ok=True)
+
+    def relative_path(self, digest, extension):
+        return f'{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+    def put(self, digest, data):
+        """Store ``data`` under its content hash once and return its path relative to the root."""
+        if self.retention_interval > 0:
+            self._retention.ensure_started()
+        relative = self.relative_path(digest, guess_extension(data))
+        path = os.path.join(self.root, relative)
+        if os.path.exists(path):
+            # Refresh the age of re-uploaded images so retention keeps them.
+            try:
+                os.utime(path)
+                return relative
+            except FileNotFoundError:
+                pass
+        fd, temp_path = self._temp_file(os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return relative
+
+    def read(self, relative):
+        """Bytes of a stored upload; FileNotFoundError once retention has removed it."""
+        with open(os.path.join(self.root, relative), 'rb') as f:
+            return f.read()
+
+    def _temp_file(self, shard):
+        try:
+            os.makedirs(shard, exist_ok=True)
+            return tempfile.mkstemp(dir=shard, suffix='.tmp')
+        except FileNotFoundError:
+            # Retention pruned the empty shard between makedirs and mkstemp.
+            os.makedirs(shard, exist_ok=True)
+            return tempfile.mkstemp(dir=shard, suffix='.tmp')
+
+    def _retention_loop(self):
+        while True:
+            time.sleep(self.retention_interval)
+            try:
+                self.compact()
+            except OSError:
+                pass
+
+    def _scan(self):
+        files = []
+        for first in os.scandir(self.root):
+            if not first.is_dir() or len(first.name) != 2:
+                continue
+            for second in os.scandir(first.path):
+                if not second.is_dir():
+                    continue
+                for entry in os.scandir(second.path):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def compact(self):
+        """Apply the age and size caps; return (files removed, bytes freed)."""
+        now = time.time()
+        removed = freed = 0
+        keep = []
+        total = 0
+        for mtime, size, path in self._scan():
+            age = now - mtime
+            stale_temp = path.endswith('.tmp') and age > STALE_TEMP_AGE
+            if stale_temp or (not path.endswith('.tmp') and age > self.max_age):
+                if self._remove(path):
+                    removed += 1
+                    freed += size
+            else:
+                keep.append((mtime, size, path))
+                total += size
+
+        keep.sort()
+        for mtime, size, path in keep:
+            if total <= self.max_bytes:
+                break
+            if path.endswith('.tmp'):
+                continue
+            if self._remove(path):
+                removed += 1
+                freed += size
+            total -= size
+
+        self._prune_empty_dirs()
+        return removed, freed
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _prune_empty_dirs(self):
+        for first in os.scandir(self.root):
+            if not first.is_dir() or len(first.name) != 2:
+                continue
+            for second in os.scandir(first.path):
+                if second.is_dir():
+                    try:
+                        os.rmdir(second.path)
+                    except OSError:
+                        pass
+            try:
+                os.rmdir(first.path)
+            except OSError:
+                pass